@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Compare inference backends: cold-start time, RSS and p50/p99 latency.
+
+Each backend is measured in a fresh subprocess so imports, model loading and
+memory are not shared between them.
+
+Usage:
+    python convert_model.py                     # produce the .tflite artifact first
+    python convert_model.py --format onnx       # ... and the .onnx artifact
+    python bench_backends.py [--backends keras,tflite,onnx] [--iterations 200]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+DEFAULT_ARTIFACTS = {
+    'keras': os.environ.get('MODEL_PATH', 'rice_emergency_model.h5'),
+    'tflite': os.environ.get('TFLITE_MODEL_PATH', 'rice_emergency_model.tflite'),
+    'onnx': os.environ.get('ONNX_MODEL_PATH', 'rice_emergency_model.onnx'),
+}
+
+
+def run_child(backend_name, model_path, iterations, num_threads, started_at):
+    """Measure one backend inside this (fresh) process and print JSON"""
+    from bench_utils import random_batch, read_memory_mb, summarize_ms, time_calls
+    from inference_backends import create_backend
+
+    backend = create_backend(backend_name, model_path, num_threads)
+    image = random_batch(1, dtype=backend.input_dtype)
+    backend(image)
+    cold_start = time.time() - started_at
+    memory_after_load = read_memory_mb()
+
+    latencies = summarize_ms(time_calls(lambda: backend(image), iterations, warmup=5))
+    result = {
+        'backend': backend_name,
+        'model_path': model_path,
+        'cold_start_s': cold_start,
+        'rss_after_load_mb': memory_after_load['rss_mb'],
+        **read_memory_mb(),
+        **latencies,
+    }
+    print('RESULT ' + json.dumps(result))
+
+
+def measure_backend(backend_name, model_path, iterations, num_threads):
+    """Spawn a child process for one backend and collect its result"""
+    command = [
+        sys.executable, os.path.abspath(__file__), '--child', backend_name,
+        '--model-path', model_path, '--iterations', str(iterations),
+        '--threads', str(num_threads), '--started-at', repr(time.time()),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True)
+
+    for line in completed.stdout.splitlines():
+        if line.startswith('RESULT '):
+            return json.loads(line[len('RESULT '):])
+
+    print(f"❌ {backend_name} benchmark failed:\n{completed.stderr[-2000:]}")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare inference backends')
+    parser.add_argument('--backends', default='keras,tflite,onnx')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('INFERENCE_NUM_THREADS', 0)))
+    parser.add_argument('--model-path', help='Artifact path (child mode / single backend)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--started-at', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.model_path, args.iterations, args.threads, args.started_at)
+        return
+
+    results = []
+    for backend_name in args.backends.split(','):
+        model_path = args.model_path or DEFAULT_ARTIFACTS.get(backend_name)
+        if not model_path or not os.path.exists(model_path):
+            print(f"⚠️ Skipping {backend_name}: artifact {model_path} not found")
+            continue
+
+        print(f"⏱️ Measuring {backend_name} ({model_path})...")
+        result = measure_backend(backend_name, model_path, args.iterations, args.threads)
+        if result:
+            results.append(result)
+
+    print(f"\n{'backend':10s} {'cold start':>11s} {'RSS':>9s} {'peak RSS':>9s} {'p50':>9s} {'p99':>9s}")
+    for r in results:
+        print(f"{r['backend']:10s} {r['cold_start_s']:10.2f}s {r['rss_mb']:7.0f}MB "
+              f"{r['peak_rss_mb']:7.0f}MB {r['p50_ms']:7.2f}ms {r['p99_ms']:7.2f}ms")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
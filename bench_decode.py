@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark decode + resize: full-resolution decode vs reduced-scale decode.
+
+The old preprocessing decoded every upload at native resolution and then
+resized to 224x224. image_preprocessing.resize_for_model() lets the JPEG
+decoder scale down in the DCT domain first (PIL draft mode) and falls back to
+an integer box reduce for PNG/WebP.
+
+For each input size and format this reports decode+resize latency, the size
+of the decoded frame, the peak RSS of a fresh process decoding that input,
+and how far the reduced path's model input and predictions move from the
+full decode.
+
+Usage:
+    python bench_decode.py [--sizes 1024,2048,4032] [--iterations 30]
+                           [--model rice_emergency_model.h5] [--tolerance 0.05]
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from bench_utils import read_memory_mb, summarize_ms, time_calls
+from image_preprocessing import MODEL_INPUT_SIZE, preprocess_image_simple
+
+SAMPLE_IMAGES = ['healthy_rice_leaf.jpg', 'diseased_rice_leaf.jpg', 'bacterial_blight_leaf.jpg']
+FORMATS = {'jpeg': ('JPEG', {'quality': 90}), 'png': ('PNG', {}), 'webp': ('WEBP', {'quality': 90})}
+
+
+def full_decode(data):
+    """The original path: decode at native resolution, then resize"""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image, image.resize(MODEL_INPUT_SIZE)
+
+
+def reduced_decode(data):
+    """The serving path: reduced-scale decode, then resize"""
+    from image_preprocessing import resize_for_model, reduce_on_decode
+
+    image = reduce_on_decode(Image.open(io.BytesIO(data)))
+    image.load()
+    return image, resize_for_model(image)
+
+
+DECODERS = {'full': full_decode, 'reduced': reduced_decode}
+
+
+def make_input(sample_path, width, fmt):
+    """Encoded bytes of a sample leaf upscaled to a phone-camera width"""
+    with Image.open(sample_path) as sample:
+        height = round(sample.height * width / sample.width)
+        image = sample.convert('RGB').resize((width, height), Image.BICUBIC)
+
+    format_name, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, format_name, **options)
+    return buffer.getvalue()
+
+
+def run_child(path, mode, iterations):
+    """Decode one file repeatedly in this (fresh) process and print JSON"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    decode = DECODERS[mode]
+    rss_before = read_memory_mb()['rss_mb']
+    decoded, _ = decode(data)
+    latencies = summarize_ms(time_calls(lambda: decode(data), iterations))
+
+    print('RESULT ' + json.dumps({
+        'decoded_size': list(decoded.size),
+        'decoded_frame_bytes': decoded.width * decoded.height * len(decoded.getbands()),
+        'peak_rss_delta_mb': read_memory_mb()['peak_rss_mb'] - rss_before,
+        **latencies,
+    }))
+
+
+def measure(path, mode, iterations):
+    """Run one decoder on one input in a child process"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', mode,
+               '--input', path, '--iterations', str(iterations)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    for line in completed.stdout.splitlines():
+        if line.startswith('RESULT '):
+            return json.loads(line[len('RESULT '):])
+    print(f"❌ {mode} decode of {path} failed:\n{completed.stderr[-2000:]}")
+    return None
+
+
+def check_tolerance(inputs, model_path, tolerance):
+    """Compare model inputs and predictions of the two decode paths"""
+    from bench_utils import load_benchmark_model
+    from inference_backends import CompiledPredictor
+
+    tf, model, model_name = load_benchmark_model(model_path)
+    predictor = CompiledPredictor(model, tf)
+
+    rows = []
+    for label, data in inputs:
+        full = preprocess_image_simple(full_decode(data)[1])
+        reduced = preprocess_image_simple(reduced_decode(data)[1])
+        full_scores, reduced_scores = predictor(np.concatenate([full, reduced]))
+        rows.append({
+            'input': label,
+            'pixel_mean_abs_diff': float(np.mean(np.abs(full - reduced))),
+            'prob_max_abs_diff': float(np.max(np.abs(full_scores - reduced_scores))),
+            'same_top1': bool(np.argmax(full_scores) == np.argmax(reduced_scores)),
+        })
+
+    print(f"\n🎯 Prediction tolerance ({model_name}, max prob diff <= {tolerance})")
+    for row in rows:
+        status = '✅' if row['same_top1'] and row['prob_max_abs_diff'] <= tolerance else '❌'
+        print(f"   {status} {row['input']:22s} pixel diff {row['pixel_mean_abs_diff']:.4f}   "
+              f"prob diff {row['prob_max_abs_diff']:.4f}   same top-1: {row['same_top1']}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1024,2048,4032', help='Input widths in pixels')
+    parser.add_argument('--formats', default='jpeg,png,webp')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH', 'rice_emergency_model.h5'))
+    parser.add_argument('--tolerance', type=float, default=0.05, help='Largest allowed probability difference')
+    parser.add_argument('--skip-tolerance', action='store_true', help='Only measure decode cost')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--input', help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.input, args.child, args.iterations)
+        return
+
+    results = {'decode': [], 'tolerance': []}
+    tolerance_inputs = []
+
+    with tempfile.TemporaryDirectory(prefix='bench_decode_') as workdir:
+        for fmt in args.formats.split(','):
+            for width in [int(w) for w in args.sizes.split(',')]:
+                data = make_input(SAMPLE_IMAGES[0], width, fmt)
+                path = os.path.join(workdir, f'leaf_{width}.{fmt}')
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+                print(f"⏱️ {fmt} {width}px ({len(data):,} bytes)...")
+                row = {'format': fmt, 'width': width, 'bytes': len(data)}
+                for mode in DECODERS:
+                    row[mode] = measure(path, mode, args.iterations)
+                results['decode'].append(row)
+
+        for sample in SAMPLE_IMAGES:
+            for width in [int(w) for w in args.sizes.split(',')]:
+                tolerance_inputs.append((f'{sample.split("_")[0]}@{width}', make_input(sample, width, 'jpeg')))
+
+    print(f"\n{'input':14s} {'decoded':>11s} {'frame':>9s} {'peak RSS':>9s} {'p50':>9s} {'speedup':>8s}")
+    for row in results['decode']:
+        if not row['full'] or not row['reduced']:
+            continue
+        for mode in DECODERS:
+            r = row[mode]
+            speedup = row['full']['p50_ms'] / r['p50_ms'] if r['p50_ms'] else 0.0
+            size = 'x'.join(str(d) for d in r['decoded_size'])
+            print(f"{row['format'] + ' ' + str(row['width']):14s} {size:>11s} "
+                  f"{r['decoded_frame_bytes'] / 1e6:7.1f}MB {r['peak_rss_delta_mb']:7.1f}MB "
+                  f"{r['p50_ms']:7.2f}ms {speedup:7.1f}x  {mode}")
+
+    if not args.skip_tolerance:
+        results['tolerance'] = check_tolerance(tolerance_inputs, args.model, args.tolerance)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if any(not r['same_top1'] or r['prob_max_abs_diff'] > args.tolerance for r in results['tolerance']):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-call inference overhead: Keras model.predict vs the compiled
+serving function used by the API (inference_backends.CompiledPredictor).
+
+Usage:
+    python bench_inference_overhead.py [--model rice_emergency_model.h5]
+                                       [--iterations 200] [--batch-sizes 1,8]
+"""
+
+import argparse
+import json
+
+from bench_utils import DEFAULT_MODEL_PATH, load_benchmark_model, random_batch, summarize_ms, time_calls
+from inference_backends import CompiledPredictor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--batch-sizes', default='1,8')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    tf, model, model_name = load_benchmark_model(args.model)
+    float_predictor = CompiledPredictor(model, tf, 'float32')
+    uint8_predictor = CompiledPredictor(model, tf, 'uint8')
+
+    results = {'model': model_name, 'tensorflow': tf.__version__, 'batches': {}}
+
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        float_batch = random_batch(batch_size)
+        uint8_batch = random_batch(batch_size, dtype='uint8')
+
+        print(f"\n⏱️ Batch size {batch_size} ({args.iterations} calls each)...")
+        timings = {
+            'model.predict': summarize_ms(time_calls(
+                lambda: model.predict(float_batch, verbose=0), args.iterations)),
+            'serving_fn[float32]': summarize_ms(time_calls(
+                lambda: float_predictor(float_batch), args.iterations)),
+            'serving_fn[uint8]': summarize_ms(time_calls(
+                lambda: uint8_predictor(uint8_batch), args.iterations)),
+        }
+        results['batches'][str(batch_size)] = timings
+
+        baseline = timings['model.predict']['p50_ms']
+        for name, stats in timings.items():
+            speedup = baseline / stats['p50_ms'] if stats['p50_ms'] else 0.0
+            print(f"   {name:22s} p50 {stats['p50_ms']:8.2f} ms   "
+                  f"p99 {stats['p99_ms']:8.2f} ms   x{speedup:.2f} vs model.predict")
+
+        overhead = baseline - timings['serving_fn[float32]']['p50_ms']
+        print(f"   📉 Per-call overhead removed: {overhead:.2f} ms")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
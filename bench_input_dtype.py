@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare the float32 and uint8 serving paths: preprocessing memory/latency,
+inference latency and end-to-end latency, plus a parity check.
+
+    float32  preprocess_image_simple: float array / 255 in Python, float graph
+    uint8    preprocess_image_uint8: raw pixels, cast and rescale in the graph
+
+Python-side allocations per preprocessed image are measured with tracemalloc
+(numpy reports its buffers to it).
+
+Usage:
+    python bench_input_dtype.py [--model rice_emergency_model.h5]
+                                [--iterations 200] [--batch-sizes 1,8]
+"""
+
+import argparse
+import json
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from bench_utils import DEFAULT_MODEL_PATH, load_benchmark_model, summarize_ms, time_calls
+from image_preprocessing import preprocess_image_simple, preprocess_image_uint8
+from inference_backends import CompiledPredictor
+
+SAMPLE_IMAGES = ['healthy_rice_leaf.jpg', 'diseased_rice_leaf.jpg', 'bacterial_blight_leaf.jpg']
+PREPROCESSORS = {'float32': preprocess_image_simple, 'uint8': preprocess_image_uint8}
+
+
+def load_samples():
+    """Decoded sample leaves (decode cost is the same for both paths)"""
+    images = []
+    for path in SAMPLE_IMAGES:
+        with Image.open(path) as image:
+            images.append(image.convert('RGB'))
+    return images
+
+
+def peak_allocation_bytes(fn):
+    """Peak Python/numpy allocation while running fn() once"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--batch-sizes', default='1,8')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    tf, model, model_name = load_benchmark_model(args.model)
+    predictors = {dtype: CompiledPredictor(model, tf, dtype) for dtype in PREPROCESSORS}
+    images = load_samples()
+
+    results = {'model': model_name, 'preprocess': {}, 'batches': {}}
+
+    print("\n🧪 Preprocessing one image")
+    for dtype, preprocess in PREPROCESSORS.items():
+        array = preprocess(images[0])
+        stats = {
+            'array_bytes': int(array.nbytes),
+            'peak_alloc_bytes': peak_allocation_bytes(lambda: preprocess(images[0])),
+            **summarize_ms(time_calls(lambda: preprocess(images[0]), args.iterations)),
+        }
+        results['preprocess'][dtype] = stats
+        print(f"   {dtype:8s} array {stats['array_bytes'] / 1024:7.0f} KB   "
+              f"peak alloc {stats['peak_alloc_bytes'] / 1024:7.0f} KB   p50 {stats['p50_ms']:6.3f} ms")
+
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        batch_images = [images[i % len(images)] for i in range(batch_size)]
+        print(f"\n⏱️ Batch size {batch_size} ({args.iterations} calls each)")
+
+        outputs = {}
+        timings = {}
+        for dtype, preprocess in PREPROCESSORS.items():
+            predictor = predictors[dtype]
+            batch = np.concatenate([preprocess(image) for image in batch_images])
+            outputs[dtype] = predictor(batch)
+
+            def end_to_end():
+                predictor(np.concatenate([preprocess(image) for image in batch_images]))
+
+            timings[dtype] = {
+                'inference': summarize_ms(time_calls(lambda: predictor(batch), args.iterations)),
+                'end_to_end': summarize_ms(time_calls(end_to_end, args.iterations)),
+            }
+            print(f"   {dtype:8s} inference p50 {timings[dtype]['inference']['p50_ms']:7.2f} ms   "
+                  f"end-to-end p50 {timings[dtype]['end_to_end']['p50_ms']:7.2f} ms   "
+                  f"p99 {timings[dtype]['end_to_end']['p99_ms']:7.2f} ms")
+
+        max_diff = float(np.max(np.abs(outputs['float32'] - outputs['uint8'])))
+        same_top1 = bool(np.all(np.argmax(outputs['float32'], 1) == np.argmax(outputs['uint8'], 1)))
+        print(f"   🎯 Parity: max prob diff {max_diff:.2e}, same top-1: {same_top1}")
+        results['batches'][str(batch_size)] = {**timings, 'max_prob_diff': max_diff, 'same_top1': same_top1}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
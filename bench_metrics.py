@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of the /metrics instrumentation (serving_metrics.py).
+
+    micro       cost of one histogram observation and one counter increment
+    scrape      time to render /metrics
+    end-to-end  server CPU per /predict/raw request with metrics recording on
+                and off, interleaved so both see the same machine state
+                (the prediction cache is disabled so every request decodes and
+                runs inference)
+
+Uses the model configured through the usual environment variables
+(INFERENCE_BACKEND, MODEL_PATH, ...).
+
+Usage:
+    python bench_metrics.py [--iterations 300] [--micro-iterations 200000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from bench_utils import summarize_ms
+
+SAMPLE_IMAGE = 'healthy_rice_leaf.jpg'
+
+
+def observation_cost_ns(fn, iterations):
+    """Average nanoseconds per fn() call, minus the empty loop"""
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter_ns() - started
+
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        pass
+    baseline = time.perf_counter_ns() - started
+    return max(0.0, (elapsed - baseline) / iterations)
+
+
+def server_cpu_times(client, body, iterations, metrics, enabled):
+    times = []
+    metrics.enabled = enabled
+    for _ in range(iterations):
+        started = time.thread_time()
+        response = client.post('/predict/raw', data=body, content_type='image/jpeg')
+        times.append(time.thread_time() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict/raw returned {response.status_code}")
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=300, help='Requests per mode')
+    parser.add_argument('--micro-iterations', type=int, default=200000)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    os.environ['PREDICTION_CACHE_ENTRIES'] = '0'
+    os.environ['NEAR_DUPLICATE_CACHE_ENTRIES'] = '0'
+
+    import rice_disease_api
+    if not rice_disease_api.model_manager.wait_ready(timeout=600):
+        print("❌ Model failed to load - set MODEL_PATH / INFERENCE_BACKEND")
+        sys.exit(1)
+    metrics = rice_disease_api.metrics
+    client = rice_disease_api.app.test_client()
+    with open(SAMPLE_IMAGE, 'rb') as f:
+        body = f.read()
+
+    stage = rice_disease_api.STAGES['decode']
+    counter = rice_disease_api.CACHE_RESULTS['miss']
+    results = {
+        'observe_ns': observation_cost_ns(lambda: stage.observe(0.003), args.micro_iterations),
+        'counter_inc_ns': observation_cost_ns(counter.inc, args.micro_iterations),
+        'labels_observe_ns': observation_cost_ns(
+            lambda: rice_disease_api.stage_seconds.labels('decode').observe(0.003), args.micro_iterations),
+    }
+    print(f"\n⏱️ Histogram observe: {results['observe_ns']:.0f} ns   "
+          f"with labels() lookup: {results['labels_observe_ns']:.0f} ns   "
+          f"counter inc: {results['counter_inc_ns']:.0f} ns")
+
+    # Interleave on/off rounds so drift affects both equally
+    on, off = [], []
+    rounds = 10
+    for _ in range(rounds):
+        off += server_cpu_times(client, body, args.iterations // rounds, metrics, False)
+        on += server_cpu_times(client, body, args.iterations // rounds, metrics, True)
+    metrics.enabled = True
+
+    results['request_cpu_off'] = summarize_ms(off)
+    results['request_cpu_on'] = summarize_ms(on)
+    overhead_ms = results['request_cpu_on']['p50_ms'] - results['request_cpu_off']['p50_ms']
+    results['overhead_pct'] = 100.0 * overhead_ms / results['request_cpu_off']['p50_ms']
+    print(f"🔬 /predict/raw server CPU p50: metrics off {results['request_cpu_off']['p50_ms']:.3f} ms   "
+          f"on {results['request_cpu_on']['p50_ms']:.3f} ms   ({results['overhead_pct']:+.2f}%)")
+
+    scrape = [0.0] * 50
+    for i in range(len(scrape)):
+        started = time.perf_counter()
+        client.get('/metrics')
+        scrape[i] = time.perf_counter() - started
+    results['scrape'] = summarize_ms(scrape)
+    print(f"📈 /metrics scrape p50 {results['scrape']['p50_ms']:.2f} ms "
+          f"({len(client.get('/metrics').data):,} bytes)")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
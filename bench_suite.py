@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Performance baseline for the /predict pipeline.
+
+Runs offline against the bundled sample JPEGs and synthetic photos at
+several resolutions and times:
+
+    stage/decode/<input>        reduced-scale JPEG decode (as served)
+    stage/perceptual_hash/<input>
+    stage/preprocess/<input>    resize + array conversion for the model dtype
+    stage/inference/batch<N>    one forward pass of the serving backend
+    stage/serialize             prediction dict + JSON response
+    e2e/predict/<input>         POST /predict (multipart) through the Flask test client
+    e2e/predict_raw/<input>     POST /predict/raw
+    e2e/predict_batch/batch<N>  POST /predict/batch with N images (time per request)
+
+The prediction caches are off so every request runs the whole pipeline.
+Uses the model configured through the usual environment variables
+(INFERENCE_BACKEND, MODEL_PATH, ...).
+
+Results are written as JSON. With --compare, each p50 is checked against a
+stored baseline and the run fails (exit 1) when any is slower by more than
+--threshold (and by more than --min-delta-ms, so sub-millisecond jitter is
+not reported).
+
+Usage:
+    python bench_suite.py [--max-batch 8] [--iterations 30] [--output bench_results.json]
+    python bench_suite.py --compare bench_baseline.json [--threshold 0.15]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+from PIL import Image
+
+from bench_utils import summarize_ms, time_calls
+
+SAMPLE_IMAGES = ['healthy_rice_leaf.jpg', 'diseased_rice_leaf.jpg', 'bacterial_blight_leaf.jpg']
+# (name, width, height) of synthetic uploads: a sample leaf resampled to common camera sizes
+SYNTHETIC_SIZES = [('224', 224, 224), ('vga', 640, 480), ('hd', 1280, 960),
+                   ('fullhd', 1920, 1080), ('12mp', 4032, 3024)]
+
+
+def make_inputs():
+    """{name: JPEG bytes} for the sample images and the synthetic sizes"""
+    inputs = {}
+    for path in SAMPLE_IMAGES:
+        with open(path, 'rb') as f:
+            inputs[os.path.splitext(path)[0]] = f.read()
+
+    with Image.open(SAMPLE_IMAGES[0]) as sample:
+        sample = sample.convert('RGB')
+        for name, width, height in SYNTHETIC_SIZES:
+            buffer = io.BytesIO()
+            sample.resize((width, height), Image.BICUBIC).save(buffer, 'JPEG', quality=90)
+            inputs[name] = buffer.getvalue()
+    return inputs
+
+
+def bench_stages(api, model, inputs, max_batch, iterations):
+    from image_preprocessing import open_image_buffer, preprocess_for_dtype, reduce_on_decode
+    from prediction_cache import perceptual_hash
+
+    entry = model.entry
+    dtype = model.backend.input_dtype
+    results = {}
+
+    def decode(data):
+        image = reduce_on_decode(open_image_buffer(data), entry.input_size)
+        image.load()
+        return image
+
+    for name, data in inputs.items():
+        image = decode(data)
+        results[f'stage/decode/{name}'] = summarize_ms(time_calls(lambda: decode(data), iterations))
+        results[f'stage/perceptual_hash/{name}'] = summarize_ms(
+            time_calls(lambda: perceptual_hash(image), iterations))
+        results[f'stage/preprocess/{name}'] = summarize_ms(
+            time_calls(lambda: preprocess_for_dtype(image, dtype, entry.input_size), iterations))
+
+    import numpy as np
+    array = preprocess_for_dtype(decode(inputs['vga']), dtype, entry.input_size)[0]
+    for batch_size in range(1, max_batch + 1):
+        batch = np.stack([array] * batch_size)
+        results[f'stage/inference/batch{batch_size}'] = summarize_ms(
+            time_calls(lambda: model.backend(batch), iterations))
+
+    row = np.asarray(model.backend(array[None]))[0]
+    with api.app.test_request_context():
+        results['stage/serialize'] = summarize_ms(time_calls(
+            lambda: api.jsonify({"success": True, "prediction": api.build_prediction(row, entry.class_names)}),
+            iterations))
+    return results
+
+
+def bench_end_to_end(api, inputs, max_batch, iterations):
+    client = api.app.test_client()
+    results = {}
+
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    for name, data in inputs.items():
+        results[f'e2e/predict/{name}'] = summarize_ms(time_calls(
+            lambda: check(client.post('/predict', data={'image': (io.BytesIO(data), 'leaf.jpg')})), iterations))
+        results[f'e2e/predict_raw/{name}'] = summarize_ms(time_calls(
+            lambda: check(client.post('/predict/raw', data=data, content_type='image/jpeg')), iterations))
+
+    for batch_size in range(1, max_batch + 1):
+        results[f'e2e/predict_batch/batch{batch_size}'] = summarize_ms(time_calls(
+            lambda: check(client.post('/predict/batch', data={
+                'images': [(io.BytesIO(inputs['vga']), f'{i}.jpg') for i in range(batch_size)]})),
+            iterations))
+    return results
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Print each benchmark against the baseline; returns the names that regressed"""
+    regressions = []
+    print(f"\n{'benchmark':45s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+    for name, current in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None or not previous['p50_ms']:
+            print(f"{name:45s} {'-':>10s} {current['p50_ms']:9.2f}ms {'new':>8s}")
+            continue
+        delta = current['p50_ms'] - previous['p50_ms']
+        change = delta / previous['p50_ms']
+        regressed = change > threshold and delta > min_delta_ms
+        if regressed:
+            regressions.append(name)
+        print(f"{name:45s} {previous['p50_ms']:9.2f}ms {current['p50_ms']:9.2f}ms "
+              f"{change * 100:+7.1f}%{'  ❌' if regressed else ''}")
+
+    missing = sorted(set(baseline['benchmarks']) - set(results['benchmarks']))
+    if missing:
+        print(f"⚠️ Not measured in this run: {', '.join(missing)}")
+    if baseline.get('environment') != results['environment']:
+        print(f"⚠️ Environment differs from the baseline: {baseline.get('environment')}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-batch', type=int, default=8, help='Benchmark batch sizes 1..N')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--skip-e2e', action='store_true', help='Only the per-stage benchmarks')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the results')
+    parser.add_argument('--compare', metavar='BASELINE', help='Fail on regressions against this results file')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Allowed p50 slowdown (0.15 = 15%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.25, help='Ignore slowdowns smaller than this')
+    args = parser.parse_args()
+
+    # Read the baseline before anything is written: --output may name the same file
+    baseline = None
+    if args.compare:
+        if os.path.exists(args.output) and os.path.samefile(args.compare, args.output):
+            parser.error("--compare and --output are the same file; write the new results elsewhere")
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    os.environ['PREDICTION_CACHE_ENTRIES'] = '0'
+    os.environ['NEAR_DUPLICATE_CACHE_ENTRIES'] = '0'
+    os.environ['TRACE_LOG_PATH'] = ''
+    os.environ['BATCH_MAX_SIZE'] = str(max(args.max_batch, int(os.environ.get('BATCH_MAX_SIZE', 8))))
+
+    import rice_disease_api as api
+    if not api.model_manager.wait_ready(timeout=600):
+        print("❌ Model failed to load - set MODEL_PATH / INFERENCE_BACKEND")
+        sys.exit(1)
+
+    with api.model_manager.lease() as model:
+        print(f"⏱️ Benchmarking {model.entry.key} ({model.entry.backend}, version {model.version})")
+        environment = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'backend': model.entry.backend,
+            'model_version': model.version,
+        }
+        inputs = make_inputs()
+        started = time.time()
+        benchmarks = bench_stages(api, model, inputs, args.max_batch, args.iterations)
+    if not args.skip_e2e:
+        benchmarks.update(bench_end_to_end(api, inputs, args.max_batch, args.iterations))
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'duration_s': time.time() - started,
+        'iterations': args.iterations,
+        'environment': environment,
+        'benchmarks': benchmarks,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 {len(benchmarks)} benchmarks written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ No regressions against the baseline")
+    else:
+        for name, summary in benchmarks.items():
+            print(f"   {name:45s} p50 {summary['p50_ms']:8.2f} ms   p90 {summary['p90_ms']:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
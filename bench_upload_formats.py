@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Compare upload formats for a single prediction: base64 JSON (/predict),
+multipart (/predict) and a raw image body (/predict/raw).
+
+Reports the request body size on the wire and the server CPU time per
+request, measured in-process through the Flask test client: process CPU time
+(all threads, so inference on the micro-batcher thread counts) spent inside
+the Flask app, excluding the test client building the request. Request
+bodies are encoded up front.
+
+After the first request the prediction is served from the prediction cache,
+so by default the numbers isolate upload parsing and decoding of the
+transport encoding. Pass --no-cache to include decode and inference.
+
+Uses the model configured through the usual environment variables
+(INFERENCE_BACKEND, MODEL_PATH, ...).
+
+Usage:
+    python bench_upload_formats.py [--sizes 600,1024,2048] [--iterations 100]
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+from bench_utils import summarize_ms
+
+SAMPLE_IMAGE = 'healthy_rice_leaf.jpg'
+
+
+def make_jpeg(height):
+    """The sample leaf re-encoded as a phone-quality JPEG of the given height"""
+    with Image.open(SAMPLE_IMAGE) as sample:
+        width = round(sample.width * height / sample.height)
+        image = sample.convert('RGB').resize((width, height), Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def build_requests(jpeg):
+    """(path, body, content type) for each upload format"""
+    from werkzeug.datastructures import FileStorage
+    from werkzeug.test import encode_multipart
+
+    upload = FileStorage(io.BytesIO(jpeg), filename='leaf.jpg', content_type='image/jpeg')
+    boundary, multipart_body = encode_multipart({'image': upload})
+    base64_body = json.dumps({'image_base64': base64.b64encode(jpeg).decode('ascii')}).encode()
+
+    return {
+        'base64_json': ('/predict', base64_body, 'application/json'),
+        'multipart': ('/predict', multipart_body, f'multipart/form-data; boundary={boundary}'),
+        'raw': ('/predict/raw', jpeg, 'image/jpeg'),
+    }
+
+
+def time_app_cpu(app):
+    """Wrap a Flask app so each request appends the process CPU seconds spent inside it to the returned list"""
+    times = []
+    wsgi_app = app.wsgi_app
+
+    def timed(environ, start_response):
+        started = time.process_time()
+        try:
+            return wsgi_app(environ, start_response)
+        finally:
+            times.append(time.process_time() - started)
+
+    app.wsgi_app = timed
+    return times
+
+
+def server_cpu_times(client, app_times, path, body, content_type, iterations):
+    """Server CPU seconds of each request handled by the Flask test client"""
+    del app_times[:]
+    for _ in range(iterations):
+        response = client.post(path, data=body, content_type=content_type)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return list(app_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='600,1024,2048', help='Image heights in pixels')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--no-cache', action='store_true', help='Disable the prediction cache')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ['PREDICTION_CACHE_ENTRIES'] = '0'
+        os.environ['NEAR_DUPLICATE_CACHE_ENTRIES'] = '0'
+
+    import rice_disease_api
+    if not rice_disease_api.model_manager.wait_ready(timeout=600):
+        print("❌ Model failed to load - set MODEL_PATH / INFERENCE_BACKEND")
+        sys.exit(1)
+    app_times = time_app_cpu(rice_disease_api.app)
+    client = rice_disease_api.app.test_client()
+
+    results = []
+    for height in [int(h) for h in args.sizes.split(',')]:
+        jpeg = make_jpeg(height)
+        print(f"\n📷 {height}px JPEG ({len(jpeg):,} bytes)")
+
+        for name, (path, body, content_type) in build_requests(jpeg).items():
+            cpu = summarize_ms(server_cpu_times(client, app_times, path, body, content_type, args.iterations))
+            row = {
+                'height': height,
+                'format': name,
+                'image_bytes': len(jpeg),
+                'wire_bytes': len(body),
+                'overhead_pct': 100.0 * (len(body) - len(jpeg)) / len(jpeg),
+                'cpu': cpu,
+            }
+            results.append(row)
+            print(f"   {name:12s} wire {row['wire_bytes']:>10,} B (+{row['overhead_pct']:5.1f}%)   "
+                  f"server CPU p50 {cpu['p50_ms']:7.3f} ms   p99 {cpu['p99_ms']:7.3f} ms")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
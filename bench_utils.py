@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the offline benchmark scripts (bench_*.py)
+"""
+
+import os
+import time
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.environ.get('MODEL_PATH', 'rice_emergency_model.h5')
+NUM_CLASSES = 9
+
+
+def percentile(values, pct):
+    """Percentile of a list of numbers (linear interpolation)"""
+    if not values:
+        return 0.0
+    return float(np.percentile(np.asarray(values, dtype=np.float64), pct))
+
+
+def summarize_ms(durations):
+    """Summarize a list of durations in seconds as milliseconds"""
+    ms = [d * 1000.0 for d in durations]
+    return {
+        'n': len(ms),
+        'mean_ms': float(np.mean(ms)) if ms else 0.0,
+        'p50_ms': percentile(ms, 50),
+        'p90_ms': percentile(ms, 90),
+        'p99_ms': percentile(ms, 99),
+        'min_ms': min(ms) if ms else 0.0,
+    }
+
+
+def time_calls(fn, iterations, warmup=3):
+    """Call fn() repeatedly and return the per-call durations in seconds"""
+    for _ in range(warmup):
+        fn()
+
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def build_standin_model(tf):
+    """Small CNN with the production model's input/output shape
+
+    Used when rice_emergency_model.h5 is not available locally, so the
+    framework overhead can still be measured.
+    """
+    layers = tf.keras.layers
+    return tf.keras.Sequential([
+        layers.Input(shape=(224, 224, 3)),
+        layers.Conv2D(16, 3, strides=2, activation='relu'),
+        layers.Conv2D(32, 3, strides=2, activation='relu'),
+        layers.Conv2D(64, 3, strides=2, activation='relu'),
+        layers.GlobalAveragePooling2D(),
+        layers.Dense(NUM_CLASSES, activation='softmax'),
+    ])
+
+
+def load_benchmark_model(model_path=DEFAULT_MODEL_PATH):
+    """Load the production model, or a stand-in CNN if it is missing"""
+    import tensorflow as tf
+
+    if os.path.exists(model_path):
+        print(f"📥 Loading {model_path}...")
+        return tf, tf.keras.models.load_model(model_path, compile=False), model_path
+
+    print(f"⚠️ {model_path} not found - benchmarking a stand-in CNN instead")
+    return tf, build_standin_model(tf), 'standin-cnn'
+
+
+def random_batch(batch_size, dtype=np.float32, seed=0):
+    """Random image batch (N, 224, 224, 3) in the model's input range"""
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(batch_size, 224, 224, 3), dtype=np.uint8)
+    if np.dtype(dtype) == np.uint8:
+        return pixels
+    return pixels.astype(np.float32) / 255.0
+
+
+def read_memory_mb():
+    """Current and peak resident set size of this process in MB"""
+    current = peak = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1]) / 1024.0
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+
+    if peak is None:
+        # ru_maxrss is in KB on Linux (resource is unavailable on Windows)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return {'rss_mb': current if current is not None else peak, 'peak_rss_mb': peak}
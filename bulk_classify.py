@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Classify a directory tree of field photos offline (e.g. an SD card from an
+extension officer) without going through the API.
+
+Uses the server's preprocessing (reduced-scale JPEG decode, resize, model
+input dtype) and its model loading (inference_backends.create_backend, or
+an entry of a model registry file). Photos are decoded in a pool of worker
+processes, a few batches ahead, while the main process runs batched
+inference, so decode and the forward pass overlap.
+
+One row per image is streamed to CSV or Parquet: path, predicted label,
+confidence, original size, an error message for unreadable files and the
+probability of every class. Completed paths are appended to a checkpoint
+file (<output>.done) after their rows are written, so an interrupted run
+continues where it stopped when started again with the same output. Rows
+written just before a crash may appear twice; the path column identifies
+them.
+
+Parquet output needs pyarrow and is written as a directory of part files
+(one per --parquet-rows rows), which a resumed run adds to.
+
+Usage:
+    python bulk_classify.py /media/sdcard results.csv
+    python bulk_classify.py photos/ results.parquet --backend onnx --model rice_emergency_model.onnx
+    python bulk_classify.py photos/ results.csv --registry model_registry.json --registry-model emergency
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from image_preprocessing import list_image_files, preprocess_for_dtype, reduce_on_decode
+from model_registry import ModelEntry, load_registry_file
+
+DEFAULT_MODEL_PATHS = {'keras': 'rice_emergency_model.h5', 'tflite': 'rice_emergency_model.tflite',
+                       'onnx': 'rice_emergency_model.onnx'}
+# Shipped next to this script, so the default works from any working directory
+DEFAULT_CLASS_NAMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'class_names_emergency.json')
+
+
+def decode_chunk(paths, root, input_dtype, size):
+    """Worker process: [(relative path, model input or None, width, height, error)]"""
+    decoded = []
+    for path in paths:
+        try:
+            with Image.open(os.path.join(root, path)) as image:
+                width, height = image.size
+                image = reduce_on_decode(image, size)
+                image.load()
+                array = preprocess_for_dtype(image, input_dtype, size)[0]
+            decoded.append((path, array, width, height, None))
+        except Exception as e:
+            decoded.append((path, None, None, None, str(e)))
+    return decoded
+
+
+def decoded_chunks(executor, chunks, root, input_dtype, size, prefetch):
+    """Decode results in order, keeping at most `prefetch` chunks in flight"""
+    pending = deque()
+    chunks = iter(chunks)
+    while True:
+        while len(pending) < prefetch:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            pending.append(executor.submit(decode_chunk, chunk, root, input_dtype, size))
+        if not pending:
+            return
+        yield pending.popleft().result()
+
+
+class CsvWriter:
+    """Appends result rows to a CSV file (header only when the file is new)"""
+
+    def __init__(self, path, columns):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(columns)
+
+    def write(self, rows):
+        """Write rows through to disk; always True (see ParquetWriter.write)"""
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return True
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Buffers rows and writes them as numbered part files in a directory"""
+
+    def __init__(self, path, columns, rows_per_part):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("❌ Parquet output needs pyarrow (pip install pyarrow) - or write a .csv")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.columns = columns
+        self.rows_per_part = rows_per_part
+        os.makedirs(path, exist_ok=True)
+        self._part = len([name for name in os.listdir(path) if name.endswith('.parquet')])
+        self._rows = []
+
+    def write(self, rows):
+        """Buffer rows; returns True when they (and all earlier ones) are on disk"""
+        self._rows.extend(rows)
+        if len(self._rows) < self.rows_per_part:
+            return False
+        self.flush()
+        return True
+
+    def flush(self):
+        if not self._rows:
+            return
+        table = self._pa.table({name: [row[i] for row in self._rows] for i, name in enumerate(self.columns)})
+        self._pq.write_table(table, os.path.join(self.path, f'part-{self._part:05d}.parquet'))
+        self._part += 1
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+
+def load_entry(args):
+    """The ModelEntry to classify with: a registry entry, or the command-line / environment model"""
+    if args.registry:
+        entries, default, _ = load_registry_file(args.registry)
+        wanted = args.registry_model or default or entries[0].key
+        for entry in entries:
+            if wanted in (entry.key, entry.name):
+                return entry
+        raise SystemExit(f"❌ No model '{wanted}' in {args.registry}")
+
+    backend = args.backend or os.environ.get('INFERENCE_BACKEND', 'keras')
+    model_path = args.model or {
+        'keras': os.environ.get('MODEL_PATH'),
+        'tflite': os.environ.get('TFLITE_MODEL_PATH'),
+        'onnx': os.environ.get('ONNX_MODEL_PATH'),
+    }.get(backend) or DEFAULT_MODEL_PATHS.get(backend, DEFAULT_MODEL_PATHS['keras'])
+    return ModelEntry('bulk', model_path, backend=backend, class_names_path=args.class_names,
+                      input_dtype=args.input_dtype or os.environ.get('SERVING_INPUT_DTYPE', 'uint8'))
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.strip()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input_dir', help='Directory tree of photos')
+    parser.add_argument('output', help='results.csv, or results.parquet (a directory of part files)')
+    parser.add_argument('--backend', choices=sorted(DEFAULT_MODEL_PATHS), help='Default: INFERENCE_BACKEND or keras')
+    parser.add_argument('--model', help='Model file (default: as the server, MODEL_PATH etc.)')
+    parser.add_argument('--class-names', default=DEFAULT_CLASS_NAMES_PATH,
+                        help='JSON list of labels (default: class_names_emergency.json next to this script)')
+    parser.add_argument('--input-dtype', choices=['uint8', 'float32'], help='Default: SERVING_INPUT_DTYPE or uint8')
+    parser.add_argument('--registry', help='Model registry file (see model_registry.py) instead of --model')
+    parser.add_argument('--registry-model', help='Registry entry ("name" or "name@version"; default: its default)')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1), help='Decode processes')
+    parser.add_argument('--threads', type=int, default=0, help='Inference threads (0: framework default)')
+    parser.add_argument('--parquet-rows', type=int, default=10000, help='Rows per Parquet part file')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and overwrite the output')
+    args = parser.parse_args()
+
+    from inference_backends import create_backend
+
+    entry = load_entry(args)
+    parquet = args.output.endswith('.parquet')
+    checkpoint_path = args.output.rstrip('/') + '.done'
+    if args.restart:
+        for path in (args.output, checkpoint_path):
+            if os.path.isfile(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                for name in os.listdir(path):
+                    os.remove(os.path.join(path, name))
+
+    paths = [os.path.relpath(path, args.input_dir) for path in list_image_files(args.input_dir)]
+    done = read_checkpoint(checkpoint_path)
+    todo = [path for path in paths if path not in done]
+    print(f"📁 {len(paths)} images in {args.input_dir}, {len(paths) - len(todo)} already processed, {len(todo)} to go")
+    if not todo:
+        return
+
+    labels = entry.class_names
+    columns = ['path', 'prediction', 'confidence', 'width', 'height', 'error'] + [f'p_{label}' for label in labels]
+    writer = (ParquetWriter(args.output, columns, args.parquet_rows) if parquet
+              else CsvWriter(args.output, columns))
+
+    print(f"📥 Loading {entry.model_path} ({entry.backend})...")
+    backend = create_backend(entry.backend, entry.model_path, num_threads=args.threads,
+                             input_dtype=entry.input_dtype)
+
+    chunks = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    unflushed = []
+    processed = classified = failed = 0
+    started = last_report = time.perf_counter()
+
+    # spawn: the workers must not inherit the inference runtime's threads through fork
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(args.workers, mp_context=context) as executor, \
+            open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+        for chunk in decoded_chunks(executor, chunks, args.input_dir, backend.input_dtype,
+                                    entry.input_size, prefetch=args.workers * 2):
+            ok = [item for item in chunk if item[1] is not None]
+            probabilities = iter(np.asarray(backend(np.stack([item[1] for item in ok]))) if ok else [])
+
+            rows = []
+            for path, array, width, height, error in chunk:
+                if array is None:
+                    rows.append([path, None, None, None, None, error] + [None] * len(labels))
+                    failed += 1
+                    continue
+                row = next(probabilities)
+                best = int(np.argmax(row))
+                rows.append([path, labels[best], float(row[best]), width, height, None] + [float(p) for p in row])
+                classified += 1
+            processed += len(chunk)
+
+            # Checkpoint only what the writer has put on disk
+            unflushed.extend(item[0] for item in chunk)
+            if writer.write(rows):
+                checkpoint.write(''.join(f'{path}\n' for path in unflushed))
+                checkpoint.flush()
+                unflushed = []
+
+            now = time.perf_counter()
+            if now - last_report >= 5 or processed == len(todo):
+                rate = processed / (now - started)
+                print(f"   {processed}/{len(todo)} images   {rate:.1f} images/s   "
+                      f"ETA {(len(todo) - processed) / rate:.0f}s" + (f"   {failed} unreadable" if failed else ''))
+                last_report = now
+
+        writer.close()
+        checkpoint.write(''.join(f'{path}\n' for path in unflushed))
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Processed {processed} images in {elapsed:.1f}s ({processed / elapsed:.1f} images/s): "
+          f"{classified} classified, {failed} unreadable -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Convert the Keras rice disease model into serving artifacts.
+
+    python convert_model.py                       # rice_emergency_model.h5 -> .tflite
+    python convert_model.py --format onnx         # rice_emergency_model.h5 -> .onnx
+    python convert_model.py --model my.h5 --output my.tflite
+    python convert_model.py --input-dtype float32 # [0, 1] float input (parity tests)
+
+By default the artifacts take raw uint8 pixels and do the cast and 1/255
+rescale inside the graph, so the server never builds a float image array.
+
+ONNX export needs the tf2onnx package (build/conversion time only).
+"""
+
+import argparse
+import os
+
+from inference_backends import build_serving_function
+
+DEFAULT_MODEL_PATH = os.environ.get('MODEL_PATH', 'rice_emergency_model.h5')
+DEFAULT_TFLITE_PATH = os.environ.get('TFLITE_MODEL_PATH', 'rice_emergency_model.tflite')
+DEFAULT_ONNX_PATH = os.environ.get('ONNX_MODEL_PATH', 'rice_emergency_model.onnx')
+DEFAULT_ONNX_OPSET = 13
+DEFAULT_INPUT_DTYPE = 'uint8'
+
+
+def load_keras_model(model_path):
+    """Load the Keras model without compiling it"""
+    import tensorflow as tf
+
+    print(f"📥 Loading {model_path}...")
+    model = tf.keras.models.load_model(model_path, compile=False)
+    print(f"📐 Input shape: {model.input_shape}  Output shape: {model.output_shape}")
+    return tf, model
+
+
+def with_uint8_input(tf, model):
+    """Wrap a Keras model so it takes raw uint8 pixels and rescales them in-graph"""
+    inputs = tf.keras.Input(shape=model.input_shape[1:], dtype='uint8', name='images')
+    return tf.keras.Model(inputs, model(tf.keras.layers.Rescaling(1 / 255.0)(inputs)))
+
+
+def make_tflite_converter(tf, model, input_dtype='float32'):
+    """TFLite converter for a Keras model (batch dimension stays variable)"""
+    if input_dtype == 'uint8':
+        model = with_uint8_input(tf, model)
+    return tf.lite.TFLiteConverter.from_keras_model(model)
+
+
+def convert_to_tflite(model_path, output_path, input_dtype=DEFAULT_INPUT_DTYPE):
+    """Convert an .h5 model to a float32 .tflite artifact"""
+    tf, model = load_keras_model(model_path)
+
+    print(f"🔧 Converting to TensorFlow Lite ({input_dtype} input)...")
+    tflite_model = make_tflite_converter(tf, model, input_dtype).convert()
+
+    with open(output_path, 'wb') as f:
+        f.write(tflite_model)
+
+    print(f"✅ Wrote {output_path} ({len(tflite_model):,} bytes)")
+    return output_path
+
+
+def convert_to_onnx(model_path, output_path, opset=DEFAULT_ONNX_OPSET, input_dtype=DEFAULT_INPUT_DTYPE):
+    """Export an .h5 model to .onnx through its fixed-signature serving function"""
+    import tf2onnx
+
+    tf, model = load_keras_model(model_path)
+    serve = build_serving_function(model, tf, input_dtype)
+
+    print(f"🔧 Exporting to ONNX (opset {opset}, {input_dtype} input)...")
+    tf2onnx.convert.from_function(
+        serve,
+        input_signature=serve.input_signature,
+        opset=opset,
+        output_path=output_path,
+    )
+
+    print(f"✅ Wrote {output_path} ({os.path.getsize(output_path):,} bytes)")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the rice disease model for serving')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Source Keras .h5 model')
+    parser.add_argument('--format', choices=['tflite', 'onnx'], default='tflite')
+    parser.add_argument('--output', help='Output path (default depends on --format)')
+    parser.add_argument('--opset', type=int, default=DEFAULT_ONNX_OPSET, help='ONNX opset version')
+    parser.add_argument('--input-dtype', choices=['uint8', 'float32'], default=DEFAULT_INPUT_DTYPE,
+                        help='uint8: raw pixels, rescaled in the graph; float32: pixels already in [0, 1]')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        raise SystemExit(1)
+
+    if args.format == 'onnx':
+        convert_to_onnx(args.model, args.output or DEFAULT_ONNX_PATH, args.opset, args.input_dtype)
+    else:
+        convert_to_tflite(args.model, args.output or DEFAULT_TFLITE_PATH, args.input_dtype)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Image preprocessing shared by the API server and the offline model tools
+(quantization, evaluation, benchmarks). Importing this module has no side
+effects, unlike importing rice_disease_api which loads the model.
+"""
+
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+MODEL_INPUT_SIZE = (224, 224)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+# resize() first shrinks by an integer factor with a cheap box reduce() while
+# the image is more than this many times larger than the target
+RESIZE_REDUCING_GAP = 2.0
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a bytes-like object, without copying it"""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._position + size, len(self._view))
+        chunk = self._view[self._position:end].tobytes()
+        self._position = max(self._position, end)
+        return chunk
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def open_image_buffer(data):
+    """Open an encoded image held in bytes, a bytearray or a memoryview (lazy decode)"""
+    return Image.open(BufferReader(data))
+
+
+def reduce_on_decode(image, size=MODEL_INPUT_SIZE):
+    """Let the JPEG decoder scale down in the DCT domain before decoding
+
+    Picks the smallest of 1/1, 1/2, 1/4 and 1/8 scale that is still at least
+    `size`, so a 4000 px photo decodes as a ~500 px one. Must be called before
+    the pixels are loaded; a no-op for other formats (PNG, WebP) and for
+    images that are already decoded.
+    """
+    if image.format == 'JPEG':
+        image.draft('RGB', size)
+    return image
+
+
+def resize_for_model(image, size=MODEL_INPUT_SIZE):
+    """RGB image at the model input size, decoding as few pixels as possible"""
+    reduce_on_decode(image, size)
+
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    return image.resize(tuple(size), reducing_gap=RESIZE_REDUCING_GAP)
+
+
+def preprocess_image_simple(image, size=MODEL_INPUT_SIZE):
+    """Simple, reliable image preprocessing"""
+    try:
+        # Convert to RGB at model input size
+        image = resize_for_model(image, size)
+
+        # Convert to array and normalize
+        image_array = np.array(image, dtype=np.float32)
+        image_array = image_array / 255.0
+
+        # Add batch dimension
+        image_array = np.expand_dims(image_array, axis=0)
+
+        return image_array
+
+    except Exception as e:
+        raise Exception(f"Image preprocessing failed: {e}")
+
+
+def preprocess_image_uint8(image, size=MODEL_INPUT_SIZE):
+    """Preprocessing for uint8-input models: raw pixels, no float conversion"""
+    try:
+        image = resize_for_model(image, size)
+
+        # Raw 0-255 pixels with a batch dimension
+        return np.expand_dims(np.asarray(image, dtype=np.uint8), axis=0)
+
+    except Exception as e:
+        raise Exception(f"Image preprocessing failed: {e}")
+
+
+def preprocess_for_dtype(image, input_dtype, size=MODEL_INPUT_SIZE):
+    """Preprocess an image for a backend with the given input dtype and (width, height)"""
+    if np.dtype(input_dtype) == np.uint8:
+        return preprocess_image_uint8(image, size)
+    return preprocess_image_simple(image, size)
+
+
+def list_image_files(directory):
+    """All image files below a directory, sorted for reproducibility"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
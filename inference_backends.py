@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Pluggable inference backends for the Rice Disease API servers.
+
+Every backend is a callable taking a preprocessed batch (N, 224, 224, 3) and
+returning the model's softmax output as a numpy array. Backends are selected
+by name through create_backend():
+
+    keras   Keras .h5 model. Keras `model.predict` builds a data adapter and
+            runs the full predict loop on every call, which dominates latency
+            for a single image, so the model is wrapped once in a
+            `tf.function` with a fixed input signature and called directly.
+            `model.predict` stays as a fallback. By default the function takes
+            raw uint8 pixels and does the cast and 1/255 rescale in the graph.
+    tflite  TensorFlow Lite artifact (see convert_model.py / quantize_model.py).
+            Only needs the lightweight `tflite_runtime` package when that is
+            installed.
+    onnx    ONNX Runtime with the CPU execution provider (see convert_model.py
+            --format onnx).
+
+A backend's input_dtype tells callers which preprocessing to use (see
+image_preprocessing.preprocess_for_dtype): uint8 backends take the decoded
+pixels as-is, float32 backends take pixels already scaled to [0, 1].
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = {}
+
+# Consecutive serving-function failures after which the keras backend stays on model.predict
+SERVE_MAX_CONSECUTIVE_FAILURES = 3
+
+
+def register_backend(cls):
+    """Class decorator adding a backend to the BACKENDS registry"""
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+class InferenceBackend:
+    """Common interface for inference backends"""
+
+    name = None
+
+    def __init__(self, model_path=None):
+        self.model_path = model_path
+        self.input_dtype = np.dtype(np.float32)
+        self.input_shape = (None, 224, 224, 3)
+        self.output_shape = (None, 9)
+
+    @classmethod
+    def load(cls, model_path, num_threads=0, inter_op_threads=0, graph_optimization='all',
+             input_dtype='uint8'):
+        """Load a model file with the shared backend options
+
+        input_dtype only applies to backends that build their own serving
+        graph (keras); exported artifacts carry their input type.
+        """
+        raise NotImplementedError
+
+    def __call__(self, batch):
+        """Run a batch (N, H, W, C) and return the model output as numpy"""
+        raise NotImplementedError
+
+    def describe(self):
+        """JSON-friendly summary for /health and /model-info"""
+        return {
+            'backend': self.name,
+            'model_path': self.model_path,
+            'input_dtype': self.input_dtype.name,
+            'input_shape': list(self.input_shape),
+            'output_shape': list(self.output_shape),
+        }
+
+
+def build_serving_function(model, tf, input_dtype='float32'):
+    """Wrap a Keras model in a compiled function with a fixed input signature
+
+    The batch dimension is left variable. A uint8 signature takes raw pixels
+    and does the cast and 1/255 rescale inside the graph.
+    """
+    height, width, channels = model.input_shape[1:]
+    dtype = tf.as_dtype(input_dtype)
+    signature = [tf.TensorSpec([None, height, width, channels], dtype, name='images')]
+
+    @tf.function(input_signature=signature)
+    def serve(images):
+        if dtype != tf.float32:
+            images = tf.cast(images, tf.float32) / 255.0
+        return model(images, training=False)
+
+    return serve
+
+
+def match_input_dtype(batch, input_dtype):
+    """Convert a uint8 pixel batch or a [0, 1] float batch to a model's input dtype"""
+    batch = np.asarray(batch)
+    if batch.dtype == input_dtype:
+        return batch
+    if batch.dtype == np.uint8:
+        return (batch.astype(np.float32) / 255.0).astype(input_dtype, copy=False)
+    if input_dtype == np.uint8:
+        return np.clip(np.round(batch * 255.0), 0, 255).astype(np.uint8)
+    return batch.astype(input_dtype)
+
+
+@register_backend
+class CompiledPredictor(InferenceBackend):
+    """Keras backend: calls the compiled serving function, falling back to model.predict"""
+
+    name = 'keras'
+
+    def __init__(self, model, tf, input_dtype='float32', model_path=None):
+        super().__init__(model_path)
+        self.model = model
+        self.input_dtype = np.dtype(input_dtype)
+        self.input_shape = tuple(model.input_shape)
+        self.output_shape = tuple(model.output_shape)
+        self.fallback_calls = 0
+        self.serve_failures = 0  # consecutive
+
+        try:
+            self.serve = build_serving_function(model, tf, input_dtype)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not build serving function, using model.predict: {e}")
+            self.serve = None
+
+    @classmethod
+    def load(cls, model_path, num_threads=0, inter_op_threads=0, graph_optimization='all',
+             input_dtype='uint8'):
+        import tensorflow as tf
+        logger.info(f"✅ TensorFlow {tf.__version__} imported")
+
+        # Configure for minimal memory usage
+        tf.config.set_soft_device_placement(True)
+
+        try:
+            if num_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError as e:
+            logger.warning(f"⚠️ Could not set TensorFlow thread counts: {e}")
+
+        # Try to allocate GPU memory incrementally
+        gpus = tf.config.experimental.list_physical_devices('GPU')
+        if gpus:
+            try:
+                for gpu in gpus:
+                    tf.config.experimental.set_memory_growth(gpu, True)
+            except:
+                pass
+
+        model = tf.keras.models.load_model(model_path, compile=False)
+        return cls(model, tf, input_dtype=input_dtype, model_path=model_path)
+
+    @property
+    def compiled(self):
+        return self.serve is not None
+
+    def __call__(self, batch):
+        """Run a batch (N, H, W, C) and return the model output as numpy"""
+        batch = match_input_dtype(batch, self.input_dtype)
+
+        if self.serve is not None:
+            try:
+                output = self.serve(batch).numpy()
+                self.serve_failures = 0
+                return output
+            except (TypeError, ValueError) as e:
+                # The batch does not match the traced signature: every call would fail
+                logger.warning(f"⚠️ Serving function rejected the input, using model.predict from now on: {e}")
+                self.serve = None
+            except Exception as e:
+                self.serve_failures += 1
+                if self.serve_failures >= SERVE_MAX_CONSECUTIVE_FAILURES:
+                    logger.warning(f"⚠️ Serving function failed {self.serve_failures} times in a row, "
+                                   f"using model.predict from now on: {e}")
+                    self.serve = None
+                else:
+                    logger.warning(f"⚠️ Serving function failed, using model.predict for this batch: {e}")
+
+        self.fallback_calls += 1
+        if self.input_dtype != np.float32:
+            batch = batch.astype(np.float32) / 255.0
+        return self.model.predict(batch, verbose=0)
+
+    def describe(self):
+        info = super().describe()
+        info['compiled'] = self.compiled
+        info['fallback_calls'] = self.fallback_calls
+        info['serve_failures'] = self.serve_failures
+        return info
+
+
+def import_tflite_interpreter():
+    """Return the lightest available TFLite Interpreter class"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+@register_backend
+class TFLiteBackend(InferenceBackend):
+    """Runs a .tflite model through the TFLite interpreter
+
+    Models exported by convert_model.py take raw uint8 pixels with the
+    rescale folded into the graph. Full-integer quantized models (see
+    quantize_model.py) take quantized uint8 input and return quantized
+    scores; outputs are dequantized back to float.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        super().__init__(model_path)
+        Interpreter = import_tflite_interpreter()
+        self.num_threads = num_threads or None
+        self.interpreter = Interpreter(model_path=model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.input_index = input_details['index']
+        self.output_index = output_details['index']
+        self.input_dtype = np.dtype(input_details['dtype'])
+        self.input_shape = tuple(int(d) for d in input_details['shape_signature'])
+        self.output_shape = tuple(int(d) for d in output_details['shape_signature'])
+        self._batch_size = int(input_details['shape'][0])
+
+        self.input_scale, self.input_zero_point = input_details['quantization']
+        self.output_scale, self.output_zero_point = output_details['quantization']
+        self.quantized = self.input_scale != 0
+
+        # Raw 0-255 pixels can be fed as-is when the input is quantized as x/255
+        self._pixels_are_quantized = (
+            self.quantized
+            and self.input_dtype == np.uint8
+            and self.input_zero_point == 0
+            and abs(self.input_scale * 255.0 - 1.0) < 1e-3
+        )
+
+        # The interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, model_path, num_threads=0, inter_op_threads=0, graph_optimization='all',
+             input_dtype='uint8'):
+        return cls(model_path, num_threads=num_threads)
+
+    def _quantize_input(self, batch):
+        """Convert uint8 pixels or 0-1 floats into the model's quantized input"""
+        batch = np.asarray(batch)
+        if batch.dtype == np.uint8 and self._pixels_are_quantized:
+            return batch
+
+        if batch.dtype == np.uint8:
+            batch = batch.astype(np.float32) / 255.0
+        info = np.iinfo(self.input_dtype)
+        quantized = np.round(batch / self.input_scale + self.input_zero_point)
+        return np.clip(quantized, info.min, info.max).astype(self.input_dtype)
+
+    def __call__(self, batch):
+        """Run a batch (N, H, W, C) and return the model output as numpy"""
+        if self.quantized:
+            batch = self._quantize_input(batch)
+        else:
+            batch = match_input_dtype(batch, self.input_dtype)
+
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+
+            self.interpreter.set_tensor(self.input_index, batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_index).copy()
+
+        if output.dtype in (np.uint8, np.int8):
+            output = (output.astype(np.float32) - self.output_zero_point) * self.output_scale
+        return output
+
+    def describe(self):
+        info = super().describe()
+        info['num_threads'] = self.num_threads
+        info['quantized'] = self.quantized
+        return info
+
+
+ONNX_GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+
+
+@register_backend
+class OnnxBackend(InferenceBackend):
+    """Runs an exported .onnx model with ONNX Runtime on CPU"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0, graph_optimization='all'):
+        super().__init__(model_path)
+        import onnxruntime as ort
+
+        if graph_optimization not in ONNX_GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(
+                f"Unknown ONNX graph optimization level: {graph_optimization} "
+                f"(expected one of {', '.join(ONNX_GRAPH_OPTIMIZATION_LEVELS)})"
+            )
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = getattr(
+            ort.GraphOptimizationLevel, ONNX_GRAPH_OPTIMIZATION_LEVELS[graph_optimization]
+        )
+
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.graph_optimization = graph_optimization
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+
+        model_input = self.session.get_inputs()[0]
+        model_output = self.session.get_outputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.dtype(np.uint8 if model_input.type == 'tensor(uint8)' else np.float32)
+        self.input_shape = tuple(d if isinstance(d, int) else None for d in model_input.shape)
+        self.output_shape = tuple(d if isinstance(d, int) else None for d in model_output.shape)
+
+    @classmethod
+    def load(cls, model_path, num_threads=0, inter_op_threads=0, graph_optimization='all',
+             input_dtype='uint8'):
+        return cls(model_path, num_threads, inter_op_threads, graph_optimization)
+
+    def __call__(self, batch):
+        """Run a batch (N, H, W, C) and return the model output as numpy"""
+        batch = match_input_dtype(batch, self.input_dtype)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def describe(self):
+        info = super().describe()
+        info['intra_op_threads'] = self.intra_op_threads
+        info['inter_op_threads'] = self.inter_op_threads
+        info['graph_optimization'] = self.graph_optimization
+        return info
+
+
+def create_backend(name, model_path, num_threads=0, inter_op_threads=0, graph_optimization='all',
+                   input_dtype='uint8'):
+    """Load a model from disk and return a callable inference backend"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found: {model_path}")
+
+    return BACKENDS[name].load(
+        model_path,
+        num_threads=num_threads,
+        inter_op_threads=inter_op_threads,
+        graph_optimization=graph_optimization,
+        input_dtype=input_dtype,
+    )
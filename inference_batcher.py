@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Dynamic micro-batching for model inference.
+
+Concurrent /predict requests are collected for a few milliseconds (or until
+the batch is full) and run through the model in a single forward pass.
+Each caller gets back its own row of the output.
+
+The queue is bounded: submit() refuses new work with QueueFullError when
+max_queue_depth items are waiting, or when the observed service rate says the
+new item could not start within max_queue_wait_ms. Items that still end up
+waiting longer than that fail with QueueTimeoutError instead of being run for
+a client that has most likely given up.
+
+Callers can also pass their own deadline (a time.monotonic() value): items
+whose deadline has passed, or whose Future was cancelled, are dropped before
+inference.
+
+An item may name the model it must run on (predict_fn). Items for different
+models are never stacked into the same forward pass, so a model swap can happen
+while requests for the old model are still queued.
+"""
+
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Weight of the newest batch in the moving average of per-item service time
+SERVICE_TIME_EWMA_ALPHA = 0.2
+
+
+class QueueFullError(Exception):
+    """The batcher cannot admit more work; retry_after is in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueTimeoutError(Exception):
+    """An item waited longer than max_queue_wait_ms and was not run"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """The caller's deadline passed before its item was run"""
+
+
+class MicroBatcher:
+    """Collects single-image requests and runs them as one batch"""
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5.0,
+                 max_queue_depth=0, max_queue_wait_ms=0, on_batch=None):
+        self.predict_fn = predict_fn
+        # on_batch(size, queue_waits_s, inference_s, failed) after every forward pass
+        self.on_batch = on_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_depth = max(0, int(max_queue_depth))  # 0: unbounded
+        self.max_queue_wait = max(0.0, float(max_queue_wait_ms)) / 1000.0  # 0: no limit
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._pending = 0
+        self._service_time = None  # EWMA of seconds per item
+
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'errors': 0,
+            'rejected': 0,
+            'expired': 0,
+            'deadline_dropped': 0,
+            'cancelled': 0,
+            'batch_size_counts': {},
+            'queue_wait_total_ms': 0.0,
+            'queue_wait_max_ms': 0.0,
+        }
+
+    def _ensure_worker(self):
+        """Start the worker thread (again, if we were forked after starting)"""
+        with self._lock:
+            if (self._worker is not None and self._worker.is_alive()
+                    and self._worker_pid == os.getpid()):
+                return
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(
+                target=self._run, name='micro-batcher', daemon=True
+            )
+            self._worker.start()
+
+    def _estimated_wait(self, pending):
+        """Seconds until an item queued behind `pending` others starts running"""
+        if self._service_time is None:
+            return 0.0
+        return pending * self._service_time
+
+    def retry_after(self, pending=None):
+        """Whole seconds a rejected client should wait before retrying (at least 1)"""
+        with self._lock:
+            pending = self._pending if pending is None else pending
+            estimate = self._estimated_wait(pending)
+        return max(1, int(math.ceil(estimate)))
+
+    def check_admission(self, count=1):
+        """Raise QueueFullError if `count` more items would not be admitted now"""
+        with self._lock:
+            self._check_admission(count)
+
+    def _check_admission(self, count):
+        if self.max_queue_depth and self._pending + count > self.max_queue_depth:
+            reason = f"Inference queue full ({self._pending} waiting, limit {self.max_queue_depth})"
+        elif self.max_queue_wait and self._estimated_wait(self._pending) > self.max_queue_wait:
+            reason = (f"Inference queue wait ~{self._estimated_wait(self._pending) * 1000:.0f} ms "
+                      f"exceeds the {self.max_queue_wait * 1000:.0f} ms limit")
+        else:
+            return
+
+        self._stats['rejected'] += count
+        retry_after = max(1, int(math.ceil(self._estimated_wait(self._pending + count))))
+        raise QueueFullError(reason, retry_after)
+
+    def submit(self, image_array, deadline=None, predict_fn=None):
+        """Queue one preprocessed image (no batch dimension), return a Future
+
+        Raises QueueFullError when the item cannot be admitted. If `deadline`
+        (time.monotonic()) passes before the item runs, the Future fails
+        with DeadlineExceededError. `predict_fn` overrides the batcher's
+        default model for this item.
+        """
+        self._ensure_worker()
+        with self._lock:
+            self._check_admission(1)
+            self._pending += 1
+
+        future = Future()
+        self._queue.put((image_array, future, time.perf_counter(), deadline,
+                         predict_fn or self.predict_fn))
+        return future
+
+    def predict(self, image_array, timeout=None, deadline=None, predict_fn=None, timings=None):
+        """Blocking helper: submit one image and wait for its output row
+
+        Gives up at `deadline` and cancels the queued item so it is not run.
+        If a `timings` dict is given it receives the item's queue_wait and
+        inference seconds and its batch_size once it has run.
+        """
+        future = self.submit(image_array, deadline, predict_fn)
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+
+        try:
+            row = future.result(timeout=timeout)
+            if timings is not None:
+                timings.update(future.timings)
+            return row
+        except FutureTimeoutError:
+            future.cancel()
+            if deadline is not None:
+                raise DeadlineExceededError("Deadline passed while waiting for inference")
+            raise
+
+    def _collect_batch(self):
+        """Block for the first item, then gather more until full or timed out"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        with self._lock:
+            self._pending -= len(batch)
+        return batch
+
+    def _drop_expired(self, batch, now):
+        """Drop cancelled items and fail those past their deadline or max_queue_wait
+
+        Returns the items that should still be run.
+        """
+        live = []
+        monotonic_now = time.monotonic()
+        for item in batch:
+            future, enqueued, deadline = item[1:4]
+            if not future.set_running_or_notify_cancel():
+                outcome = 'cancelled'
+            elif deadline is not None and monotonic_now > deadline:
+                future.set_exception(DeadlineExceededError(
+                    f"Deadline passed {(monotonic_now - deadline) * 1000:.0f} ms before inference"))
+                outcome = 'deadline_dropped'
+            elif self.max_queue_wait and now - enqueued > self.max_queue_wait:
+                future.set_exception(QueueTimeoutError(
+                    f"Waited {(now - enqueued) * 1000:.0f} ms in the inference queue",
+                    self.retry_after()))
+                outcome = 'expired'
+            else:
+                live.append(item)
+                continue
+
+            with self._lock:
+                self._stats[outcome] += 1
+        return live
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            batch = self._drop_expired(batch, started)
+
+            # One forward pass per model (normally there is only one)
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[4], []).append(item)
+            for predict_fn, group in groups.items():
+                self._run_group(predict_fn, group, started)
+                started = time.perf_counter()
+
+    def _run_group(self, predict_fn, batch, started):
+        try:
+            inputs = np.stack([item[0] for item in batch])
+            outputs = np.asarray(predict_fn(inputs))
+        except Exception as e:
+            self._record(batch, started, failed=True)
+            for item in batch:
+                item[1].set_exception(e)
+            return
+
+        if outputs.shape[:1] != (len(batch),):
+            self._record(batch, started, failed=True)
+            error = ValueError(f"Model output of shape {outputs.shape} for a batch of {len(batch)}")
+            for item in batch:
+                item[1].set_exception(error)
+            return
+
+        elapsed = self._record(batch, started)
+        for row, item in zip(outputs, batch):
+            # Per-item timings for callers reporting them (Future attribute)
+            item[1].timings = {'queue_wait': started - item[2], 'inference': elapsed, 'batch_size': len(batch)}
+            item[1].set_result(row)
+
+    def _record(self, batch, started, failed=False):
+        waits_ms = [(started - item[2]) * 1000.0 for item in batch]
+        size = len(batch)
+        elapsed = time.perf_counter() - started
+        per_item = elapsed / size
+
+        if self.on_batch is not None:
+            # A failing metrics hook must not take down the worker thread
+            try:
+                self.on_batch(size, [wait / 1000.0 for wait in waits_ms], elapsed, failed)
+            except Exception as e:
+                logger.error(f"❌ on_batch callback failed: {e}")
+
+        with self._lock:
+            if self._service_time is None:
+                self._service_time = per_item
+            else:
+                self._service_time += SERVICE_TIME_EWMA_ALPHA * (per_item - self._service_time)
+
+            stats = self._stats
+            stats['requests'] += size
+            stats['batches'] += 1
+            if failed:
+                stats['errors'] += 1
+            stats['batch_size_counts'][size] = stats['batch_size_counts'].get(size, 0) + 1
+            stats['queue_wait_total_ms'] += sum(waits_ms)
+            stats['queue_wait_max_ms'] = max(stats['queue_wait_max_ms'], max(waits_ms))
+        return elapsed
+
+    def get_stats(self):
+        """Snapshot of batch-size and queue-wait statistics"""
+        with self._lock:
+            stats = dict(self._stats)
+            batch_size_counts = dict(stats['batch_size_counts'])
+            pending = self._pending
+            service_time = self._service_time
+
+        requests = stats['requests']
+        batches = stats['batches']
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'requests': requests,
+            'batches': batches,
+            'errors': stats['errors'],
+            'rejected': stats['rejected'],
+            'expired': stats['expired'],
+            'deadline_dropped': stats['deadline_dropped'],
+            'cancelled': stats['cancelled'],
+            'queue_depth': pending,
+            'queue_depth_limit': self.max_queue_depth,
+            'queue_wait_limit_ms': self.max_queue_wait * 1000.0,
+            'service_time_ms': service_time * 1000.0 if service_time is not None else None,
+            'throughput_per_s': 1.0 / service_time if service_time else None,
+            'avg_batch_size': requests / batches if batches else 0.0,
+            'batch_size_counts': {str(k): v for k, v in sorted(batch_size_counts.items())},
+            'avg_queue_wait_ms': stats['queue_wait_total_ms'] / requests if requests else 0.0,
+            'max_queue_wait_ms': stats['queue_wait_max_ms'],
+        }
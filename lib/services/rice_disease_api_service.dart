@@ -138,6 +138,9 @@ class RiceDiseaseApiService {
         await http.MultipartFile.fromPath('image', imageFile.path),
       );
       
+      // Let the server drop the request once we have stopped waiting for it
+      request.headers['X-Request-Timeout-Ms'] = _longTimeout.inMilliseconds.toString();
+      
       // Send request
       final streamedResponse = await request.send().timeout(_longTimeout);
       final response = await http.Response.fromStream(streamedResponse);
@@ -175,7 +178,10 @@ class RiceDiseaseApiService {
       
       final response = await http.post(
         Uri.parse('$baseUrl$predictEndpoint'),
-        headers: {'Content-Type': 'application/json'},
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Request-Timeout-Ms': _longTimeout.inMilliseconds.toString(),
+        },
         body: json.encode({'image_base64': base64Image}),
       ).timeout(_longTimeout);
       
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Open-loop load test of a locally started API server.
+
+Requests are sent on a Poisson schedule at a fixed offered rate, whether or
+not earlier ones have finished (a closed loop of N clients slows down with
+the server and hides its queueing). Latency is measured from each request's
+scheduled send time, so time spent waiting for a free client connection is
+counted too. Uploads are a mix of multipart, base64 JSON and raw bodies of
+the sample leaves and synthetic photos; a few bytes after the JPEG end
+marker make every upload unique so the prediction cache does not answer.
+
+With --deadline-ms, each request carries an absolute X-Request-Deadline
+counted from its scheduled send time, like its latency, so time spent queued
+before the server reads it counts against the deadline too (client and
+server share a clock, as only local servers are tested).
+
+For each rate it reports throughput, goodput (200 responses within --slo-ms
+per second), error rate, status codes and p50/p95/p99/p99.9 latency. A sweep
+over several rates finds the saturation knee: the highest rate that is still
+served at >= 90% goodput with under 1% errors.
+
+Unless --url is given, the server is started on a free localhost port
+(`python rice_disease_api.py`, or --server-cmd, e.g. gunicorn) with the
+model configured through the usual environment variables, and stopped at
+the end. Only loopback addresses are accepted as targets.
+
+Usage:
+    python load_test.py [--rates 2,4,8,16,32] [--duration 30] [--deadline-ms 2000]
+    python load_test.py --server-cmd "gunicorn --bind 127.0.0.1:{port} --threads 8 rice_disease_api:app"
+    python load_test.py --url http://127.0.0.1:5000 --rates 10 --min-knee-rps 8
+"""
+
+import argparse
+import base64
+import ipaddress
+import json
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from bench_suite import make_inputs
+from bench_utils import percentile
+
+DEFAULT_INPUTS = 'healthy_rice_leaf,diseased_rice_leaf,bacterial_blight_leaf,vga,fullhd,12mp'
+DEFAULT_MIX = 'multipart=0.6,base64=0.3,raw=0.1'
+# A rate is saturated below this share of goodput or above this error rate
+KNEE_GOODPUT_RATIO = 0.9
+KNEE_ERROR_RATE = 0.01
+
+
+class Upload:
+    """One input image, padded so unique suffixes can be appended to its base64 too"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data + b'\0' * (-len(data) % 3)
+        self.base64 = base64.b64encode(self.data).decode()
+
+    def body(self, unique):
+        suffix = unique.to_bytes(12, 'big') if unique is not None else b''
+        return self.data + suffix, self.base64 + base64.b64encode(suffix).decode()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        if kind not in ('multipart', 'base64', 'raw'):
+            raise ValueError(f"Unknown upload kind '{kind}'")
+        mix[kind] = float(weight)
+    return mix
+
+
+def check_local(url):
+    host = urlparse(url).hostname
+    try:
+        loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise SystemExit(f"❌ {url} is not a localhost address - load tests only run locally")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(server_cmd, ready_timeout):
+    """Start the API on a free port; returns (process, base url, log path)"""
+    port = free_port()
+    command = shlex.split(server_cmd.format(port=port)) if server_cmd else [sys.executable, 'rice_disease_api.py']
+    log_path = os.path.join(tempfile.mkdtemp(prefix='rice-loadtest-'), 'server.log')
+    env = {**os.environ, 'PORT': str(port)}
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    url = f'http://127.0.0.1:{port}'
+    print(f"🚀 Started {' '.join(command)} on port {port} (log: {log_path})")
+    deadline = time.time() + ready_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ Server exited with code {process.returncode} - see {log_path}")
+        try:
+            if requests.get(f'{url}/health', timeout=2).json().get('model_loaded'):
+                return process, url, log_path
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(1)
+    process.terminate()
+    raise SystemExit(f"❌ Model not loaded after {ready_timeout}s - see {log_path}")
+
+
+_local = threading.local()
+
+
+def session():
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def send(url, kind, upload, unique, headers, timeout):
+    """Status code of one prediction request (0 for a connection error or timeout)"""
+    raw, encoded = upload.body(unique)
+    try:
+        if kind == 'multipart':
+            response = session().post(f'{url}/predict', files={'image': ('leaf.jpg', raw, 'image/jpeg')},
+                                      headers=headers, timeout=timeout)
+        elif kind == 'base64':
+            response = session().post(f'{url}/predict', json={'image_base64': encoded},
+                                      headers=headers, timeout=timeout)
+        else:
+            response = session().post(f'{url}/predict/raw', data=raw,
+                                      headers={**headers, 'Content-Type': 'image/jpeg'}, timeout=timeout)
+        return response.status_code
+    except requests.RequestException:
+        return 0
+
+
+def run_rate(url, rate, duration, uploads, mix, args, seed):
+    """Drive one open-loop rate; returns its summary"""
+    rng = random.Random(seed)
+    arrivals = []
+    at = rng.expovariate(rate)
+    while at < duration:
+        arrivals.append((at, rng.choices(list(mix), weights=list(mix.values()))[0], rng.choice(uploads)))
+        at += rng.expovariate(rate)
+
+    timeout = max(30.0, 2 * args.deadline_ms / 1000.0)
+    results = []
+    in_flight = peak_in_flight = 0
+    lock = threading.Lock()
+
+    def one(scheduled, kind, upload, unique):
+        nonlocal in_flight, peak_in_flight
+        with lock:
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+        headers = {}
+        if args.deadline_ms:
+            scheduled_wall = time.time() - (time.perf_counter() - scheduled)
+            headers['X-Request-Deadline'] = str(int(scheduled_wall * 1000 + args.deadline_ms))
+        status = send(url, kind, upload, None if args.allow_cache_hits else unique, headers, timeout)
+        finished = time.perf_counter()
+        with lock:
+            in_flight -= 1
+            results.append((status, finished - scheduled, finished))
+
+    started = time.perf_counter() + 0.05
+    with ThreadPoolExecutor(args.max_in_flight) as pool:
+        for i, (offset, kind, upload) in enumerate(arrivals):
+            scheduled = started + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(one, scheduled, kind, upload, seed * 10_000_000 + i)
+
+    elapsed = max(duration, max((r[2] for r in results), default=started) - started)
+    latencies_ms = [r[1] * 1000.0 for r in results]
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = sum(1 for status, _, _ in results if status == 200)
+    good = sum(1 for status, latency, _ in results if status == 200 and latency * 1000.0 <= args.slo_ms)
+
+    return {
+        'offered_rps': rate,
+        'sent': len(results),
+        'duration_s': elapsed,
+        'throughput_rps': ok / elapsed,
+        'goodput_rps': good / elapsed,
+        'error_rate': (len(results) - ok) / len(results) if results else 0.0,
+        'statuses': statuses,
+        'peak_in_flight': peak_in_flight,
+        'latency_ms': {
+            'p50': percentile(latencies_ms, 50),
+            'p95': percentile(latencies_ms, 95),
+            'p99': percentile(latencies_ms, 99),
+            'p99_9': percentile(latencies_ms, 99.9),
+            'max': max(latencies_ms, default=0.0),
+        },
+    }
+
+
+def saturated(summary):
+    return (summary['goodput_rps'] < KNEE_GOODPUT_RATIO * summary['offered_rps']
+            or summary['error_rate'] > KNEE_ERROR_RATE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Running local server (default: start one)')
+    parser.add_argument('--server-cmd', help='Command starting the server; {port} is replaced')
+    parser.add_argument('--rates', default='2,4,8,16,32', help='Offered requests/s, ascending')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per rate')
+    parser.add_argument('--inputs', default=DEFAULT_INPUTS, help='Images to upload (see bench_suite.py)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Upload kind weights')
+    parser.add_argument('--deadline-ms', type=float, default=2000.0,
+                        help='Deadline after each scheduled send, sent as X-Request-Deadline (0: none)')
+    parser.add_argument('--slo-ms', type=float, help='Latency counted as goodput (default: the deadline)')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Client connections')
+    parser.add_argument('--allow-cache-hits', action='store_true', help='Repeat identical uploads')
+    parser.add_argument('--keep-going', action='store_true', help='Run every rate past the knee')
+    parser.add_argument('--min-knee-rps', type=float, help='Exit 1 if the knee is below this rate')
+    parser.add_argument('--ready-timeout', type=float, default=600.0)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+    args.slo_ms = args.slo_ms or args.deadline_ms or 1000.0
+
+    rates = [float(rate) for rate in args.rates.split(',')]
+    mix = parse_mix(args.mix)
+    inputs = make_inputs()
+    uploads = [Upload(name, inputs[name]) for name in args.inputs.split(',')]
+
+    process = None
+    if args.url:
+        url = args.url.rstrip('/')
+        check_local(url)
+    else:
+        process, url, _ = start_server(args.server_cmd, args.ready_timeout)
+
+    try:
+        print("🔥 Warming up...")
+        for i, upload in enumerate(uploads * 3):
+            send(url, 'raw', upload, i, {}, 60)
+
+        print(f"\n{'rate':>7s} {'sent':>6s} {'tput/s':>7s} {'good/s':>7s} {'errors':>7s} "
+              f"{'p50':>8s} {'p95':>8s} {'p99':>8s} {'p99.9':>8s}")
+        summaries = []
+        for i, rate in enumerate(rates):
+            summary = run_rate(url, rate, args.duration, uploads, mix, args, seed=i + 1)
+            summaries.append(summary)
+            latency = summary['latency_ms']
+            print(f"{rate:7.1f} {summary['sent']:6d} {summary['throughput_rps']:7.1f} "
+                  f"{summary['goodput_rps']:7.1f} {summary['error_rate'] * 100:6.1f}% "
+                  f"{latency['p50']:7.0f}ms {latency['p95']:7.0f}ms {latency['p99']:7.0f}ms "
+                  f"{latency['p99_9']:7.0f}ms{'  🔥 saturated' if saturated(summary) else ''}")
+            if saturated(summary) and not args.keep_going:
+                break
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    knee = None
+    for summary in summaries:
+        if saturated(summary):
+            break
+        knee = summary['offered_rps']
+    print(f"\n📈 Saturation knee: {f'{knee:.1f} requests/s' if knee else 'below the lowest rate'}"
+          f"{'' if summaries and saturated(summaries[-1]) else ' (not reached - try higher rates)'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'config': {key: value for key, value in vars(args).items() if key != 'url'},
+                'knee_rps': knee,
+                'rates': summaries,
+            }, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.min_knee_rps is not None and (knee or 0) < args.min_knee_rps:
+        print(f"❌ Knee below the required {args.min_knee_rps:.1f} requests/s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
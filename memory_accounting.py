@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Memory accounting for the API worker.
+
+Every `sample_every` requests the worker records its resident set size
+(RSS), the Python heap as seen by tracemalloc (when tracing) and the
+TensorFlow allocator statistics (when TensorFlow is loaded and has a device
+that reports them). The recent samples are kept so growth can be read as a
+rate - bytes per 1000 requests over the newer half of the history, past the
+start-up allocations - instead of being guessed from one number.
+
+tracemalloc slows every allocation down, so it is off unless started
+(MEMORY_TRACEMALLOC_FRAMES, or through /admin/memory). While it runs, the
+top allocators are reported as growth since tracing started, which is what
+points at a leak.
+
+    accountant = MemoryAccountant(sample_every=100)
+    accountant.record_request()      # after every request
+    accountant.report(top=10)
+"""
+
+import gc
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def read_rss_bytes():
+    """Current resident set size, or None where it cannot be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def read_peak_rss_bytes():
+    """Largest resident set size the process has had"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KB
+
+
+def read_tf_memory():
+    """{device: {current, peak} bytes} from TensorFlow's allocators; {} if unavailable
+
+    Only reads TensorFlow when it is already imported (never imports it).
+    CPU devices do not report allocator statistics; GPUs do.
+    """
+    tf = sys.modules.get('tensorflow')
+    if tf is None:
+        return {}
+
+    devices = {}
+    try:
+        for device in tf.config.list_logical_devices():
+            try:
+                info = tf.config.experimental.get_memory_info(device.name)
+            except (ValueError, RuntimeError):
+                continue
+            devices[device.name] = {'current_bytes': info.get('current'), 'peak_bytes': info.get('peak')}
+    except Exception:
+        return {}
+    return devices
+
+
+def growth_per_1000(samples, field):
+    """Least-squares slope of samples[field] against request count, per 1000 requests"""
+    points = [(s['requests'], s[field]) for s in samples if s.get(field) is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    return 1000.0 * sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+class MemoryAccountant:
+    """Samples process memory every `sample_every` requests"""
+
+    def __init__(self, sample_every=100, history=288, tracemalloc_frames=0):
+        self.sample_every = max(1, int(sample_every))
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._samples = deque(maxlen=max(2, int(history)))
+        self._baseline = None
+        self._tracing_since = None
+        if tracemalloc_frames:
+            self.start_tracing(tracemalloc_frames)
+
+    def record_request(self):
+        """Count one request; take a sample when the count reaches the next multiple"""
+        with self._lock:
+            self._requests += 1
+            due = self._requests % self.sample_every == 0
+        if due:
+            self.sample()
+
+    def read(self):
+        """RSS, traced Python heap and TF allocator bytes right now"""
+        traced = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+        return {
+            'time': time.time(),
+            'requests': self._requests,
+            'rss_bytes': read_rss_bytes(),
+            'python_heap_bytes': traced[0],
+            'python_heap_peak_bytes': traced[1],
+            'tf': read_tf_memory(),
+            'gc_counts': gc.get_count(),
+        }
+
+    def sample(self):
+        """Read memory now and keep it in the history"""
+        sample = self.read()
+        with self._lock:
+            self._samples.append(sample)
+        return sample
+
+    def start_tracing(self, frames=1):
+        """Start tracemalloc; allocator growth is measured from this point"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, int(frames)))
+        self._baseline = tracemalloc.take_snapshot()
+        self._tracing_since = self._requests
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self._baseline = None
+        self._tracing_since = None
+
+    def top_allocators(self, top=10):
+        """Source lines whose live allocations grew the most since tracing started"""
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            return []
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, linecache.__file__)]
+        snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+        baseline = self._baseline.filter_traces(filters)
+        allocators = []
+        for stat in snapshot.compare_to(baseline, 'lineno')[:top]:
+            frame = stat.traceback[0]
+            allocators.append({
+                'location': f"{frame.filename}:{frame.lineno}",
+                'size_bytes': stat.size,
+                'growth_bytes': stat.size_diff,
+                'count': stat.count,
+                'count_growth': stat.count_diff,
+            })
+        return allocators
+
+    def report(self, top=10):
+        """Current memory, recent samples, growth rates and (when tracing) top allocators"""
+        current = self.read()
+        with self._lock:
+            samples = list(self._samples)
+        recent = samples[len(samples) // 2:]
+
+        return {
+            'requests': self._requests,
+            'sample_every': self.sample_every,
+            'rss_bytes': current['rss_bytes'],
+            'peak_rss_bytes': read_peak_rss_bytes(),
+            'python_heap_bytes': current['python_heap_bytes'],
+            'tf': current['tf'],
+            'rss_growth_per_1000_requests': growth_per_1000(recent, 'rss_bytes'),
+            'python_heap_growth_per_1000_requests': growth_per_1000(recent, 'python_heap_bytes'),
+            'tracemalloc': {
+                'tracing': tracemalloc.is_tracing(),
+                'frames': tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else 0,
+                'since_request': self._tracing_since,
+                'top_allocators': self.top_allocators(top),
+            },
+            'samples': samples,
+        }
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Model lifecycle management for the API server.
+
+The model is loaded by one background thread, so the server answers /health
+and / immediately while TensorFlow and the weights load. Only one load ever
+runs at a time: requests never load the model themselves, they wait (briefly)
+for the shared loader instead. A failed load is retried with exponential
+backoff.
+
+States: idle -> loading -> ready, or loading -> failed -> loading -> ...
+
+Once ready, the model can be replaced without downtime: reload() loads and
+validates a candidate beside the serving model, then swaps it in with a single
+assignment. Requests hold a lease on the model they started with, so requests
+already running finish on the old model; it is released once its last lease
+is returned. watch() triggers a reload when the model file changes on disk,
+and unload() gives the memory back (model_registry evicts idle models this way).
+"""
+
+import contextlib
+import gc
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel:
+    """A loaded backend and its version, reference-counted by the requests using it
+
+    `entry` is whatever configuration the loader wants to keep with the model
+    (the API stores its model_registry.ModelEntry: labels, preprocessing).
+    """
+
+    def __init__(self, backend, version, model_path=None, entry=None):
+        self.backend = backend
+        self.version = version
+        self.model_path = model_path
+        self.entry = entry
+        self.loaded_at = time.time()
+        self.warmup = None  # timings recorded by the loader, if it warms the model up
+
+        self._lock = threading.Lock()
+        self._leases = 0
+        self._retired = False
+        self.drained = threading.Event()
+
+    def acquire(self):
+        with self._lock:
+            self._leases += 1
+
+    def release(self):
+        with self._lock:
+            self._leases -= 1
+            if self._retired and self._leases == 0:
+                self.drained.set()
+
+    def retire(self):
+        """Mark as replaced; `drained` is set once no request holds a lease"""
+        with self._lock:
+            self._retired = True
+            if self._leases == 0:
+                self.drained.set()
+
+    @property
+    def in_flight(self):
+        return self._leases
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'model_path': self.model_path,
+            'loaded_at': self.loaded_at,
+            'in_flight': self._leases,
+            'warmup': self.warmup,
+        }
+
+
+class ModelManager:
+    """Single-flight background loader with failure backoff and hot reload
+
+    load_fn() returns a LoadedModel (or raises). validate_fn(candidate, current)
+    raises if a reloaded candidate must not replace the current model, and may
+    return a JSON-friendly report.
+    """
+
+    def __init__(self, load_fn, retry_initial_seconds=5.0, retry_max_seconds=300.0, max_attempts=0,
+                 validate_fn=None, drain_timeout_seconds=300.0):
+        self.load_fn = load_fn
+        self.validate_fn = validate_fn
+        self.drain_timeout_seconds = float(drain_timeout_seconds)
+        self.retry_initial_seconds = max(0.1, float(retry_initial_seconds))
+        self.retry_max_seconds = max(self.retry_initial_seconds, float(retry_max_seconds))
+        self.max_attempts = int(max_attempts)  # 0: retry forever
+
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._attempt_done = threading.Condition(self._lock)  # notified when a load attempt ends
+        self._thread = None
+        self._pid = None
+
+        self.state = 'idle'
+        self.attempts = 0
+        self.last_error = None
+        self.created_at = time.time()
+        self.load_started_at = None
+        self.last_attempt_seconds = None
+        self.ready_at = None
+        self._next_retry_at = None
+
+        # listener(event) after a load finishes: 'ready', or 'failed' once retries are exhausted
+        self.listeners = []
+
+        self.current = None
+        self.reloads = 0
+        self.last_reload = None
+        self._reload_thread = None
+        self._watch_thread = None
+
+    def start(self):
+        """Start the loader thread if it is not running (again, after a fork)"""
+        with self._lock:
+            if self._ready.is_set():
+                return
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self.state == 'failed' and self._next_retry_at is None:
+                return  # gave up after max_attempts
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='model-loader', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        backoff = self.retry_initial_seconds
+
+        while True:
+            with self._lock:
+                self.state = 'loading'
+                self.attempts += 1
+                self.load_started_at = time.time()
+                self._next_retry_at = None
+            started = time.perf_counter()
+
+            try:
+                model = self.load_fn()
+            except Exception as e:
+                with self._lock:
+                    self.state = 'failed'
+                    self.last_attempt_seconds = time.perf_counter() - started
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    gave_up = bool(self.max_attempts and self.attempts >= self.max_attempts)
+                    if not gave_up:
+                        self._next_retry_at = time.monotonic() + backoff
+                    self._attempt_done.notify_all()
+                if gave_up:
+                    logger.error(f"❌ Model load attempt {self.attempts} failed, giving up: {self.last_error}")
+                    self._notify('failed')
+                    return
+
+                logger.error(f"❌ Model load attempt {self.attempts} failed ({self.last_error}), "
+                             f"retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.retry_max_seconds)
+                continue
+
+            with self._lock:
+                self.current = model
+                self.state = 'ready'
+                self.last_attempt_seconds = time.perf_counter() - started
+                self.ready_at = time.time()
+                self.last_error = None
+                self._attempt_done.notify_all()
+            self._ready.set()
+            logger.info(f"✅ Model ready after {self.last_attempt_seconds:.1f}s (attempt {self.attempts})")
+            self._notify('ready')
+            return
+
+    def _notify(self, event):
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"❌ Model {event} listener failed: {e}")
+
+    @property
+    def gave_up(self):
+        """True once loading failed max_attempts times (start() will not retry)"""
+        return self.state == 'failed' and self._next_retry_at is None and not self._ready.is_set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        """Wait for the shared load to finish; True once the model is ready"""
+        self.start()
+        return self._ready.wait(timeout)
+
+    def wait_loading(self, timeout=None):
+        """Wait while a load attempt runs; True once the model is ready
+
+        Unlike wait_ready(), returns False as soon as the attempt fails, and
+        at once while waiting out the retry backoff after a failure.
+        """
+        self.start()
+        with self._attempt_done:
+            self._attempt_done.wait_for(lambda: self.state in ('ready', 'failed'), timeout)
+            return self.state == 'ready'
+
+    def acquire(self):
+        """Lease the serving model (None if not loaded); pair with release()"""
+        with self._lock:
+            model = self.current
+            if model is not None:
+                model.acquire()
+        return model
+
+    def release(self, model):
+        model.release()
+
+    @contextlib.contextmanager
+    def lease(self):
+        """Context manager yielding the serving model, held until the block exits"""
+        model = self.acquire()
+        if model is None:
+            raise RuntimeError("Model is not loaded")
+        try:
+            yield model
+        finally:
+            model.release()
+
+    def reload(self, reason='manual'):
+        """Start loading a replacement in the background
+
+        Returns False if the first load has not finished or a reload is
+        already running.
+        """
+        with self._lock:
+            if not self._ready.is_set():
+                return False
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self.last_reload = {'state': 'loading', 'reason': reason, 'started_at': time.time()}
+            self._reload_thread = threading.Thread(
+                target=self._reload, args=(reason,), name='model-reloader', daemon=True)
+            self._reload_thread.start()
+        return True
+
+    def _reload(self, reason):
+        started = time.perf_counter()
+        logger.info(f"🔄 Reloading model ({reason})...")
+        previous = self.current
+        try:
+            candidate = self.load_fn()
+            if candidate.version == previous.version:
+                with self._lock:
+                    self.last_reload.update(state='unchanged', version=candidate.version,
+                                            load_seconds=time.perf_counter() - started)
+                logger.info(f"✅ Model {candidate.version} is already serving; nothing to swap")
+                return
+            report = self.validate_fn(candidate, previous) if self.validate_fn else None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            with self._lock:
+                self.last_reload.update(state='failed', error=error,
+                                        load_seconds=time.perf_counter() - started)
+            logger.error(f"❌ Model reload failed, still serving {previous.version}: {error}")
+            return
+
+        with self._lock:
+            self.current = candidate
+            self.reloads += 1
+            self.last_reload.update(state='draining', validation=report,
+                                    previous_version=previous.version, version=candidate.version,
+                                    load_seconds=time.perf_counter() - started, swapped_at=time.time())
+        logger.info(f"✅ Now serving model {candidate.version} (was {previous.version}); "
+                    f"draining {previous.in_flight} in-flight requests")
+
+        drained = self._release(previous)
+        with self._lock:
+            self.last_reload.update(state='done', drained=drained,
+                                    total_seconds=time.perf_counter() - started)
+
+    def _release(self, model):
+        """Wait for requests that leased a replaced model to finish, then drop it"""
+        model.retire()
+        drained = model.drained.wait(self.drain_timeout_seconds)
+        if drained:
+            model.backend = None
+            gc.collect()
+            logger.info(f"🗑️ Released model {model.version}")
+        else:
+            logger.warning(f"⚠️ Model {model.version} still has {model.in_flight} requests "
+                           f"after {self.drain_timeout_seconds:.0f}s; leaving it to the garbage collector")
+        return drained
+
+    def unload(self):
+        """Stop serving the loaded model and free it once its leases are returned
+
+        Returns False unless a model was ready and no reload is running.
+        start() loads it again.
+        """
+        with self._lock:
+            model = self.current
+            if model is None or (self._reload_thread is not None and self._reload_thread.is_alive()):
+                return False
+            self.current = None
+            self._ready.clear()
+            self.state = 'idle'
+            self._thread = None
+
+        threading.Thread(target=self._release, args=(model,), name='model-release', daemon=True).start()
+        return True
+
+    def watch(self, fingerprint_fn, interval_seconds):
+        """Reload whenever fingerprint_fn() changes (checked every interval_seconds)
+
+        A change is acted on once the fingerprint has been stable for one
+        interval, so a model file that is still being copied is not loaded.
+        """
+        with self._lock:
+            if self._watch_thread is not None and self._watch_thread.is_alive():
+                return
+            self._watch_thread = threading.Thread(
+                target=self._watch, args=(fingerprint_fn, float(interval_seconds)),
+                name='model-watcher', daemon=True)
+            self._watch_thread.start()
+
+    def _watch(self, fingerprint_fn, interval_seconds):
+        loaded = fingerprint_fn()
+        seen = loaded
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                fingerprint = fingerprint_fn()
+            except Exception as e:
+                logger.warning(f"⚠️ Model watcher could not read the model file: {e}")
+                continue
+
+            if not self._ready.is_set():
+                loaded = seen = fingerprint  # the next load picks up the new file
+            elif fingerprint != loaded and fingerprint == seen:
+                if self.reload('model file changed'):
+                    loaded = fingerprint
+            seen = fingerprint
+
+    def retry_after(self):
+        """Whole seconds a client should wait before trying again (at least 1)"""
+        with self._lock:
+            next_retry_at = self._next_retry_at
+        if next_retry_at is None:
+            return 5
+        return max(1, int(next_retry_at - time.monotonic() + 1))
+
+    def status(self):
+        """JSON-friendly state and timings for /health"""
+        with self._lock:
+            # One snapshot: an unload() or reload can change these meanwhile
+            state = self.state
+            model = self.current
+            reloads = self.reloads
+            last_reload = dict(self.last_reload) if self.last_reload else None
+            info = {
+                'state': state,
+                'attempts': self.attempts,
+                'last_error': self.last_error,
+                'last_attempt_seconds': self.last_attempt_seconds,
+                'load_started_at': self.load_started_at,
+                'ready_at': self.ready_at,
+                'next_retry_in_seconds': (max(0.0, self._next_retry_at - time.monotonic())
+                                          if self._next_retry_at is not None else None),
+            }
+        if state == 'ready' and model is not None:
+            info['time_to_ready_seconds'] = info['ready_at'] - self.created_at
+            info['model'] = model.describe()
+            info['reloads'] = reloads
+            info['last_reload'] = last_reload
+        elif state == 'loading':
+            info['loading_for_seconds'] = time.time() - info['load_started_at']
+        return info
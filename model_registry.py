@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Registry of the models the API server can serve side by side.
+
+Each entry names a model artifact together with its own label list and
+preprocessing config, so regional or variety-specific models and
+experimental models can run next to the production one. Entries are keyed
+"name@version" (just "name" when no version is given); a request selects one
+by key or by name, which picks the first entry listed with that name.
+
+Entries come from a JSON file (MODEL_REGISTRY_PATH, see
+model_registry.example.json):
+
+    {
+      "default": "emergency",
+      "memory_budget_mb": 1024,
+      "models": [
+        {"name": "emergency", "version": "v1", "backend": "keras",
+         "model_path": "rice_emergency_model.h5",
+         "class_names_path": "class_names_emergency.json",
+         "input_dtype": "uint8", "input_size": [224, 224], "pinned": true}
+      ]
+    }
+
+Models load lazily on first use, each through its own ModelManager (so loads
+are single-flight, retried with backoff and hot-reloadable). When loading one
+would push the resident models past the memory budget, the least recently
+used models are unloaded first (never the default model or pinned ones);
+requests already running on them finish before their memory is freed.
+Models still loading cannot be evicted yet, so the budget is checked again
+whenever a load finishes and on every hit while the registry is over it.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ENTRY_DEFAULTS = {
+    'version': None,
+    'backend': 'keras',
+    'class_names': None,
+    'class_names_path': None,
+    'input_dtype': 'uint8',
+    'input_size': [224, 224],
+    'pinned': False,
+    'memory_mb': None,
+    'description': '',
+}
+
+
+class ModelEntry:
+    """Configuration of one servable model"""
+
+    def __init__(self, name, model_path, base_dir='.', **options):
+        unknown = set(options) - set(ENTRY_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Model '{name}': unknown options {sorted(unknown)}")
+        options = {**ENTRY_DEFAULTS, **options}
+
+        self.name = name
+        self.version = options['version']
+        self.backend = options['backend']
+        self.model_path = os.path.join(base_dir, model_path)
+        self.input_dtype = options['input_dtype']
+        self.input_size = tuple(options['input_size'])
+        self.pinned = bool(options['pinned'])
+        self.memory_mb = options['memory_mb']
+        self.description = options['description']
+
+        self.class_names = options['class_names']
+        if self.class_names is None and options['class_names_path']:
+            with open(os.path.join(base_dir, options['class_names_path'])) as f:
+                self.class_names = json.load(f)
+        if not self.class_names:
+            raise ValueError(f"Model '{name}' needs class_names or class_names_path")
+
+    @property
+    def key(self):
+        return f"{self.name}@{self.version}" if self.version else self.name
+
+    def estimated_bytes(self):
+        """Resident memory estimate: memory_mb if configured, else the model file size"""
+        if self.memory_mb is not None:
+            return int(self.memory_mb * 1024 * 1024)
+        try:
+            return os.path.getsize(self.model_path)
+        except OSError:
+            return 0
+
+    def describe(self):
+        return {
+            'key': self.key,
+            'name': self.name,
+            'version': self.version,
+            'backend': self.backend,
+            'model_path': self.model_path,
+            'input_dtype': self.input_dtype,
+            'input_size': list(self.input_size),
+            'num_classes': len(self.class_names),
+            'pinned': self.pinned,
+            'estimated_mb': self.estimated_bytes() / (1024 * 1024),
+            'description': self.description,
+        }
+
+
+def load_registry_file(path):
+    """(entries, default key, memory budget in bytes or None) from a registry JSON file"""
+    with open(path) as f:
+        config = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    entries = [ModelEntry(base_dir=base_dir, **options) for options in config['models']]
+    budget_mb = config.get('memory_budget_mb')
+    budget = int(budget_mb * 1024 * 1024) if budget_mb is not None else None
+    return entries, config.get('default'), budget
+
+
+class UnknownModelError(KeyError):
+    """No registry entry matches the requested model"""
+
+
+class ModelRegistry:
+    """Model entries with lazy loading and LRU residency under a memory budget
+
+    manager_factory(entry) builds the (not yet started) ModelManager of an
+    entry. memory_budget_bytes of 0 means no limit.
+    """
+
+    def __init__(self, entries, manager_factory, default=None, memory_budget_bytes=0):
+        if not entries:
+            raise ValueError("The model registry needs at least one model")
+
+        self.entries = OrderedDict()
+        for entry in entries:
+            if entry.key in self.entries:
+                raise ValueError(f"Duplicate model '{entry.key}'")
+            self.entries[entry.key] = entry
+
+        self.default_key = self.resolve(default).key if default else entries[0].key
+        self.memory_budget_bytes = max(0, int(memory_budget_bytes or 0))
+        self.managers = {key: manager_factory(entry) for key, entry in self.entries.items()}
+        for key, manager in self.managers.items():
+            manager.listeners.append(lambda event, key=key: self._on_load_finished(key, event))
+
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()  # key -> estimated bytes, least recently used first
+        self._last_used = {}
+        self._stats = {key: {'hits': 0, 'loads': 0, 'evictions': 0} for key in self.entries}
+        self._over_budget_loads = 0
+
+    @property
+    def default_manager(self):
+        return self.managers[self.default_key]
+
+    def resolve(self, selector=None):
+        """Entry for "name@version", "name" or None (the default model)"""
+        if not selector:
+            return self.entries[self.default_key]
+        if selector in self.entries:
+            return self.entries[selector]
+        for entry in self.entries.values():
+            if entry.name == selector:
+                return entry
+        raise UnknownModelError(selector)
+
+    def get(self, selector=None):
+        """(entry, manager) for a selector, starting a lazy load if it is not resident
+
+        Raises UnknownModelError for a selector that matches no entry.
+        """
+        entry, manager, _ = self._select(selector, lease=False)
+        return entry, manager
+
+    def acquire(self, selector=None):
+        """(entry, manager, leased LoadedModel or None) for a selector
+
+        Like get(), but a resident, loaded model is leased in the same step,
+        so it cannot be evicted between being selected and being used. The
+        model is None while it is (re)loading; release it with model.release().
+        """
+        return self._select(selector, lease=True)
+
+    def _select(self, selector, lease):
+        entry = self.resolve(selector)
+        manager = self.managers[entry.key]
+
+        with self._lock:
+            self._last_used[entry.key] = time.time()
+            if entry.key in self._resident:
+                self._resident.move_to_end(entry.key)
+                self._stats[entry.key]['hits'] += 1
+                model = manager.acquire() if lease else None
+                evict = self._choose_evictions(entry.key) if self._over_budget() else []
+                loading = False
+            elif manager.gave_up:
+                model, evict, loading = None, [], False
+            else:
+                needed = entry.estimated_bytes()
+                evict = self._choose_evictions(entry.key, needed, loading=True)
+                self._resident[entry.key] = needed
+                self._stats[entry.key]['loads'] += 1
+                model, loading = None, True
+
+        for key in evict:
+            self._evict(key)
+        if loading:
+            logger.info(f"📦 Loading model '{entry.key}' on demand (~{needed / (1024 * 1024):.0f} MB)")
+            manager.start()
+        return entry, manager, model
+
+    def _over_budget(self):
+        return bool(self.memory_budget_bytes) and sum(self._resident.values()) > self.memory_budget_bytes
+
+    def _choose_evictions(self, key, needed=0, loading=False):
+        """Least recently used unpinned, loaded models to drop to fit `needed` more bytes
+
+        `key` is never chosen. Models still loading are skipped; the check runs
+        again when they finish (see _on_load_finished).
+        """
+        if not self.memory_budget_bytes:
+            return []
+
+        total = sum(self._resident.values())
+        evict = []
+        for candidate, size in self._resident.items():
+            if total + needed <= self.memory_budget_bytes:
+                break
+            if (candidate == key or candidate == self.default_key or self.entries[candidate].pinned
+                    or not self.managers[candidate].ready):
+                continue
+            evict.append(candidate)
+            total -= size
+
+        for candidate in evict:
+            del self._resident[candidate]
+        if loading and total + needed > self.memory_budget_bytes:
+            self._over_budget_loads += 1
+            logger.warning(f"⚠️ Loading '{key}' exceeds the model memory budget "
+                           f"({(total + needed) / (1024 * 1024):.0f} of "
+                           f"{self.memory_budget_bytes / (1024 * 1024):.0f} MB)")
+        return evict
+
+    def _on_load_finished(self, key, event):
+        """Manager listener: re-check the budget, and stop counting models that will never load"""
+        with self._lock:
+            if event == 'failed':
+                self._resident.pop(key, None)
+                logger.warning(f"⚠️ Model '{key}' failed to load; no longer counted against the memory budget")
+            evict = self._choose_evictions(key) if self._over_budget() else []
+        for candidate in evict:
+            self._evict(candidate)
+
+    def _evict(self, key):
+        if self.managers[key].unload():
+            logger.info(f"♻️ Evicted model '{key}' (least recently used)")
+            with self._lock:
+                self._stats[key]['evictions'] += 1
+        else:
+            # Busy reloading: keep it and count it as resident again
+            with self._lock:
+                self._resident[key] = self.entries[key].estimated_bytes()
+                self._resident.move_to_end(key, last=False)
+
+    def start_pinned(self):
+        """Start loading the default model and every pinned model now"""
+        for key, entry in self.entries.items():
+            if entry.pinned or key == self.default_key:
+                self.get(key)
+
+    def get_stats(self):
+        """Residency, memory and per-model load/evict/hit counters"""
+        with self._lock:
+            resident = dict(self._resident)
+            stats = {key: dict(counters) for key, counters in self._stats.items()}
+            last_used = dict(self._last_used)
+            over_budget_loads = self._over_budget_loads
+
+        models = {}
+        for key, entry in self.entries.items():
+            # Locked snapshot: an eviction can unload the model meanwhile
+            status = self.managers[key].status()
+            model = status.get('model')
+            models[key] = {
+                'state': status['state'],
+                'resident': key in resident,
+                'pinned': entry.pinned,
+                'estimated_mb': entry.estimated_bytes() / (1024 * 1024),
+                'last_used_at': last_used.get(key),
+                'version': model['version'] if model is not None else None,
+                **stats[key],
+            }
+
+        return {
+            'default': self.default_key,
+            'memory_budget_mb': self.memory_budget_bytes / (1024 * 1024) if self.memory_budget_bytes else None,
+            'resident_mb': sum(resident.values()) / (1024 * 1024),
+            'resident': list(resident),
+            'over_budget_loads': over_budget_loads,
+            'hits': sum(s['hits'] for s in stats.values()),
+            'loads': sum(s['loads'] for s in stats.values()),
+            'evictions': sum(s['evictions'] for s in stats.values()),
+            'models': models,
+        }
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Content-addressed prediction cache.
+
+Farmers often re-submit the same photo after a timeout. Predictions are cached
+by a hash of the raw upload bytes plus the model version, so a resubmission is
+answered without decoding, resizing or running the model again.
+
+A retaken photo of the same leaf has different bytes, so an optional second
+tier (NearDuplicateCache) keys predictions by a 64-bit DCT perceptual hash of
+the decoded image and serves any recent entry within a Hamming distance. The
+DCT hash only sees luminance, so it is tagged with the image's coarse mean
+colour and only images with the same colour tag are compared.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Rough per-entry bookkeeping overhead (key, OrderedDict node, tuple)
+ENTRY_OVERHEAD_BYTES = 256
+
+# Perceptual hash: 8x8 lowest DCT frequencies of a 32x32 grayscale thumbnail
+HASH_SIZE = 8
+HASH_IMAGE_SIZE = 32
+HASH_BITS = HASH_SIZE * HASH_SIZE
+# Colour tag above the hash bits: mean of each RGB channel in 8 levels
+COLOR_LEVELS = 8
+# Thumbnails flatter than this (grayscale std dev) have no structure to hash
+MIN_HASH_STDDEV = 2.0
+
+
+def make_cache_key(image_data, model_version):
+    """Cache key for raw upload bytes served by a given model version"""
+    digest = hashlib.sha256(image_data)
+    digest.update(str(model_version).encode())
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with a TTL and a memory bound"""
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl_seconds=3600):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key, size)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        """Store a JSON-serializable value, evicting least recently used entries"""
+        if not self.enabled:
+            return
+
+        size = len(json.dumps(value)) + len(key) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (value, size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+
+    def _remove(self, key, size):
+        del self._entries[key]
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self):
+        """Hit rate, size and eviction counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+            size_bytes = self._bytes
+
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'size_bytes': size_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+            **stats,
+        }
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II basis as a (size, size) matrix"""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] *= 1 / np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+_DCT = _dct_matrix(HASH_IMAGE_SIZE)
+
+
+def perceptual_hash(image):
+    """DCT hash of a PIL image, robust to re-encoding and small shifts
+
+    The low HASH_BITS bits hash the grayscale structure; the bits above them
+    tag the coarse mean colour, which must match exactly. Returns None for a
+    near-uniform image, whose DCT bits would be the same whatever its colour.
+    """
+    thumbnail = image.convert('RGB').resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.BILINEAR)
+    rgb = np.asarray(thumbnail, dtype=np.float64)
+    pixels = np.asarray(thumbnail.convert('L'), dtype=np.float64)
+    if pixels.std() < MIN_HASH_STDDEV:
+        return None
+
+    low_frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    bits = (low_frequencies > np.median(low_frequencies)).flatten()
+    structure = int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    color = 0
+    for mean in rgb.reshape(-1, 3).mean(axis=0):
+        color = color * COLOR_LEVELS + min(int(mean * COLOR_LEVELS / 256), COLOR_LEVELS - 1)
+    return (color << HASH_BITS) | structure
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateCache:
+    """LRU cache of predictions keyed by perceptual hash, with Hamming-radius lookup
+
+    Uses multi-index hashing: the 64 hash bits are split into max_distance + 1
+    chunks and each chunk value is indexed separately. Two hashes within
+    max_distance bits must agree exactly on at least one chunk (pigeonhole),
+    so a lookup only compares against entries sharing a chunk instead of
+    scanning the whole cache.
+
+    Entries are grouped by namespace (the model version) and by the colour tag
+    above the hash bits, so predictions from different models or for
+    differently coloured images never match each other.
+    """
+
+    def __init__(self, max_entries=0, max_distance=3, ttl_seconds=3600):
+        self.max_entries = int(max_entries)
+        self.max_distance = int(max_distance)
+        self.ttl_seconds = float(ttl_seconds)
+
+        chunks = self.max_distance + 1
+        if not 0 < chunks <= HASH_BITS:
+            raise ValueError(f"max_distance must be between 0 and {HASH_BITS - 1}")
+
+        # (shift, mask) for each chunk; sizes differ by at most one bit
+        self._chunks = []
+        shift = 0
+        for i in range(chunks):
+            width = HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0)
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+
+        self._entries = OrderedDict()  # (namespace, hash) -> (value, expires_at)
+        self._index = [{} for _ in self._chunks]  # (namespace, colour, chunk value) -> set of hashes
+        self._lock = threading.Lock()
+
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'candidates_checked': 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _chunk_keys(self, namespace, image_hash):
+        color = image_hash >> HASH_BITS
+        for (shift, mask), table in zip(self._chunks, self._index):
+            yield table, (namespace, color, (image_hash >> shift) & mask)
+
+    def get(self, namespace, image_hash):
+        """(cached value, Hamming distance) of the closest live entry, or None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            candidates = set()
+            for table, chunk_key in self._chunk_keys(namespace, image_hash):
+                candidates.update(table.get(chunk_key, ()))
+            self._stats['candidates_checked'] += len(candidates)
+
+            now = time.monotonic()
+            best = None
+            for candidate in candidates:
+                distance = hamming_distance(image_hash, candidate)
+                if distance > self.max_distance or (best and distance >= best[1]):
+                    continue
+                value, expires_at = self._entries[(namespace, candidate)]
+                if expires_at <= now:
+                    self._remove(namespace, candidate)
+                    self._stats['expirations'] += 1
+                    continue
+                best = (candidate, distance)
+
+            if best is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end((namespace, best[0]))
+            self._stats['hits'] += 1
+            return self._entries[(namespace, best[0])][0], best[1]
+
+    def put(self, namespace, image_hash, value):
+        """Store a value under a perceptual hash, evicting least recently used entries"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            key = (namespace, image_hash)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                for table, chunk_key in self._chunk_keys(namespace, image_hash):
+                    table.setdefault(chunk_key, set()).add(image_hash)
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+
+            while len(self._entries) > self.max_entries:
+                evicted_namespace, evicted_hash = next(iter(self._entries))
+                self._remove(evicted_namespace, evicted_hash)
+                self._stats['evictions'] += 1
+
+    def _remove(self, namespace, image_hash):
+        del self._entries[(namespace, image_hash)]
+        for table, chunk_key in self._chunk_keys(namespace, image_hash):
+            bucket = table[chunk_key]
+            bucket.discard(image_hash)
+            if not bucket:
+                del table[chunk_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for table in self._index:
+                table.clear()
+
+    def get_stats(self):
+        """Hit rate, size and index selectivity counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            entries = len(self._entries)
+
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'enabled': self.enabled,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'max_distance': self.max_distance,
+            'ttl_seconds': self.ttl_seconds,
+            'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+            'avg_candidates_per_lookup': stats['candidates_checked'] / lookups if lookups else 0.0,
+            **stats,
+        }
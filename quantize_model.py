@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+INT8 post-training quantization of the rice disease model with an accuracy gate.
+
+Builds a representative calibration set (a directory of real leaf photos, or
+the synthetic leaves from create_test_rice_images.py), converts the model to a
+full-integer TFLite artifact with uint8 input/output, and re-runs the per-class
+evaluation that produced classification_report.json. The artifact is refused
+if any class's f1-score drops by more than --max-f1-drop.
+
+The evaluation set is a directory with one sub-directory per class label from
+class_names_emergency.json (bacterial_leaf_blight/, brown_spot/, ...).
+
+Usage:
+    python quantize_model.py --eval-dir dataset/test
+    python quantize_model.py --eval-dir dataset/test --calibration-dir dataset/train \\
+        --max-f1-drop 0.02 --output rice_emergency_model_int8.tflite
+
+Serve the result with INFERENCE_BACKEND=tflite and
+TFLITE_MODEL_PATH=rice_emergency_model_int8.tflite.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from convert_model import DEFAULT_MODEL_PATH, load_keras_model, make_tflite_converter
+from image_preprocessing import list_image_files, preprocess_for_dtype, preprocess_image_simple
+from inference_backends import CompiledPredictor, TFLiteBackend
+
+DEFAULT_OUTPUT_PATH = 'rice_emergency_model_int8.tflite'
+DEFAULT_REPORT_PATH = 'classification_report_int8.json'
+CLASS_LABELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'class_names_emergency.json')
+
+
+def load_class_labels(path=CLASS_LABELS_PATH):
+    """Class labels in model output order"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def generate_calibration_images(count, seed=0):
+    """Synthetic leaves from the generators in create_test_rice_images.py"""
+    import create_test_rice_images as generators
+
+    makers = [
+        generators.create_realistic_healthy_rice_leaf,
+        generators.create_realistic_diseased_rice_leaf,
+        generators.create_bacterial_blight_leaf,
+    ]
+    random.seed(seed)
+
+    # The generators save to fixed file names in the working directory
+    images = []
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='calibration_')
+    try:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(count):
+                path = makers[i % len(makers)]()
+                with Image.open(path) as image:
+                    images.append(image.copy())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return images
+
+
+def load_calibration_images(directory, count, seed=0):
+    """A random sample of real images from a directory tree"""
+    paths = list_image_files(directory)
+    random.Random(seed).shuffle(paths)
+
+    images = []
+    for path in paths[:count]:
+        with Image.open(path) as image:
+            images.append(image.convert('RGB'))
+    return images
+
+
+def build_calibration_set(calibration_dir=None, count=200, seed=0):
+    """Preprocessed (1, 224, 224, 3) float arrays for the representative dataset"""
+    if calibration_dir:
+        print(f"📁 Loading up to {count} calibration images from {calibration_dir}...")
+        images = load_calibration_images(calibration_dir, count, seed)
+    else:
+        print(f"🎨 Generating {count} synthetic calibration leaves...")
+        images = generate_calibration_images(count, seed)
+
+    if not images:
+        raise ValueError("Calibration set is empty")
+
+    arrays = [preprocess_image_simple(image) for image in images]
+
+    # Pin the input range to [0, 1] so the quantized uint8 input is exactly
+    # the raw 0-255 pixel value (scale 1/255, zero point 0)
+    arrays.append(np.zeros((1, 224, 224, 3), dtype=np.float32))
+    arrays.append(np.ones((1, 224, 224, 3), dtype=np.float32))
+
+    print(f"✅ Calibration set: {len(arrays)} samples")
+    return arrays
+
+
+def quantize_to_int8(tf, model, calibration):
+    """Full-integer quantization with uint8 input and output"""
+    converter = make_tflite_converter(tf, model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: ([sample] for sample in calibration)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.uint8
+    return converter.convert()
+
+
+def load_eval_set(eval_dir, labels):
+    """(image path, class index) pairs from one sub-directory per class"""
+    samples = []
+    for class_index, label in enumerate(labels):
+        class_dir = os.path.join(eval_dir, label)
+        if not os.path.isdir(class_dir):
+            print(f"⚠️ No evaluation images for {label} ({class_dir} missing)")
+            continue
+        samples.extend((path, class_index) for path in list_image_files(class_dir))
+    return samples
+
+
+def predict_classes(predict_fn, input_dtype, samples, batch_size=32):
+    """Predicted class index for every sample, in order"""
+    predicted = []
+    for start in range(0, len(samples), batch_size):
+        arrays = []
+        for path, _ in samples[start:start + batch_size]:
+            with Image.open(path) as image:
+                arrays.append(preprocess_for_dtype(image, input_dtype)[0])
+        outputs = predict_fn(np.stack(arrays))
+        predicted.extend(int(i) for i in np.argmax(outputs, axis=1))
+    return predicted
+
+
+def build_classification_report(y_true, y_pred, labels):
+    """Per-class precision/recall/f1 in the classification_report.json format"""
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    report = {}
+    per_class = []
+
+    for class_index, label in enumerate(labels):
+        true_positive = int(np.sum((y_pred == class_index) & (y_true == class_index)))
+        predicted = int(np.sum(y_pred == class_index))
+        support = int(np.sum(y_true == class_index))
+
+        precision = true_positive / predicted if predicted else 0.0
+        recall = true_positive / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+        report[label] = {'precision': precision, 'recall': recall, 'f1-score': f1, 'support': support}
+        per_class.append((precision, recall, f1, support))
+
+    total = len(y_true)
+    report['accuracy'] = float(np.mean(y_true == y_pred)) if total else 0.0
+
+    metrics = np.array([row[:3] for row in per_class])
+    supports = np.array([row[3] for row in per_class], dtype=np.float64)
+    macro = metrics.mean(axis=0)
+    weighted = (metrics * supports[:, None]).sum(axis=0) / supports.sum() if supports.sum() else macro
+
+    for name, values in (('macro avg', macro), ('weighted avg', weighted)):
+        report[name] = {
+            'precision': float(values[0]),
+            'recall': float(values[1]),
+            'f1-score': float(values[2]),
+            'support': total,
+        }
+    return report
+
+
+def find_f1_regressions(baseline, candidate, labels, max_f1_drop):
+    """Classes whose f1-score dropped by more than max_f1_drop"""
+    regressions = []
+    for label in labels:
+        if label not in baseline or label not in candidate:
+            continue
+        drop = baseline[label]['f1-score'] - candidate[label]['f1-score']
+        if drop > max_f1_drop:
+            regressions.append((label, baseline[label]['f1-score'], candidate[label]['f1-score'], drop))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='Source Keras .h5 model')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH, help='Quantized .tflite output path')
+    parser.add_argument('--eval-dir', required=True, help='Labelled evaluation images (one folder per class)')
+    parser.add_argument('--calibration-dir', help='Real leaf images for calibration (default: synthetic leaves)')
+    parser.add_argument('--calibration-count', type=int, default=200)
+    parser.add_argument('--baseline-report', help='Compare against a stored report instead of re-evaluating the float model')
+    parser.add_argument('--max-f1-drop', type=float, default=0.01, help='Largest allowed per-class f1 drop')
+    parser.add_argument('--report', default=DEFAULT_REPORT_PATH, help='Where to write the quantized model report')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    labels = load_class_labels()
+    samples = load_eval_set(args.eval_dir, labels)
+    if not samples:
+        print(f"❌ No evaluation images found in {args.eval_dir}")
+        raise SystemExit(1)
+    print(f"📊 Evaluation set: {len(samples)} images")
+
+    tf, model = load_keras_model(args.model)
+    calibration = build_calibration_set(args.calibration_dir, args.calibration_count, args.seed)
+
+    print("🔧 Quantizing to full-integer INT8...")
+    quantized = quantize_to_int8(tf, model, calibration)
+
+    fd, candidate_path = tempfile.mkstemp(suffix='.tflite')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(quantized)
+
+    try:
+        y_true = [class_index for _, class_index in samples]
+
+        if args.baseline_report:
+            with open(args.baseline_report) as f:
+                baseline = json.load(f)
+            print(f"📄 Baseline: {args.baseline_report}")
+        else:
+            print("🔮 Evaluating float32 model...")
+            float_predictor = CompiledPredictor(model, tf)
+            baseline = build_classification_report(
+                y_true, predict_classes(float_predictor, np.float32, samples, args.batch_size), labels)
+
+        print("🔮 Evaluating INT8 model...")
+        backend = TFLiteBackend(candidate_path)
+        candidate = build_classification_report(
+            y_true, predict_classes(backend, backend.input_dtype, samples, args.batch_size), labels)
+
+        print(f"\n{'class':24s} {'float f1':>9s} {'int8 f1':>9s} {'drop':>8s}")
+        for label in labels:
+            if label in baseline and label in candidate:
+                base_f1 = baseline[label]['f1-score']
+                cand_f1 = candidate[label]['f1-score']
+                print(f"{label:24s} {base_f1:9.4f} {cand_f1:9.4f} {base_f1 - cand_f1:8.4f}")
+        print(f"{'accuracy':24s} {baseline['accuracy']:9.4f} {candidate['accuracy']:9.4f}")
+
+        regressions = find_f1_regressions(baseline, candidate, labels, args.max_f1_drop)
+        if regressions:
+            print(f"\n❌ Quantized model refused: f1 dropped by more than {args.max_f1_drop} for:")
+            for label, base_f1, cand_f1, drop in regressions:
+                print(f"   - {label}: {base_f1:.4f} -> {cand_f1:.4f} (-{drop:.4f})")
+            raise SystemExit(1)
+
+        shutil.move(candidate_path, args.output)
+        with open(args.report, 'w') as f:
+            json.dump(candidate, f, indent=2)
+
+        print(f"\n✅ Quantized model accepted: {args.output} ({len(quantized):,} bytes)")
+        print(f"📄 Report written to {args.report}")
+
+    finally:
+        if os.path.exists(candidate_path):
+            os.remove(candidate_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Per-request trace records written off the request thread.
+
+The API server builds one dict per prediction request (request ID, model,
+outcome and a per-stage time breakdown matching its Server-Timing header).
+TraceWriter hands it to a logging.handlers.QueueHandler; a QueueListener
+thread serializes it to JSON and appends it to a RotatingFileHandler. The
+request thread only enqueues a reference: no JSON encoding, no file I/O and
+no lock shared with the disk. When the queue is full (the disk cannot keep
+up) records are dropped and counted rather than blocking requests.
+
+Each line of the trace file is one JSON object.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import uuid
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Client-supplied request IDs are echoed back only if they look like IDs
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+
+def make_request_id(supplied=None):
+    """The client's request ID if it is well-formed, otherwise a new random one"""
+    if supplied and REQUEST_ID_PATTERN.match(supplied):
+        return supplied
+    return uuid.uuid4().hex
+
+
+def format_server_timing(timings, descriptions=None):
+    """Server-Timing header value from {name: seconds} (and optional {name: description})"""
+    parts = []
+    for name, seconds in timings.items():
+        part = f'{name};dur={seconds * 1000.0:.2f}'
+        if descriptions and name in descriptions:
+            part += f';desc="{descriptions[name]}"'
+        parts.append(part)
+    for name, description in (descriptions or {}).items():
+        if name not in timings:
+            parts.append(f'{name};desc="{description}"')
+    return ', '.join(parts)
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, default=str, separators=(',', ':'))
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks and never formats on the caller's thread"""
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record  # the listener's formatter turns record.msg (a dict) into JSON
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TraceWriter:
+    """Appends JSON trace records to a rotating file from a background thread"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=3, queue_size=10000):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                           encoding='utf-8', delay=True)
+        file_handler.setFormatter(_JsonFormatter())
+
+        self._handler = _DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self._logger = logging.getLogger(f'{__name__}.{id(self)}')
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(self._handler)
+
+        self._listener = QueueListener(self._handler.queue, file_handler)
+        self._listener.start()
+        self.written = 0
+        atexit.register(self.close)
+
+    def write(self, record):
+        """Queue one trace record (a JSON-serializable dict)"""
+        self.written += 1
+        self._logger.info(record)
+
+    def close(self):
+        """Flush queued records and stop the writer thread"""
+        if self._listener._thread is not None:
+            self._listener.stop()
+
+    def get_stats(self):
+        return {
+            'path': self.path,
+            'queued': self.written,
+            'dropped': self._handler.dropped,
+            'backlog': self._handler.queue.qsize(),
+        }
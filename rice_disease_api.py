@@ -1,12 +1,30 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 from flask_cors import CORS
 import base64
 import io
-from PIL import Image
+import json
+from PIL import Image, UnidentifiedImageError
 import numpy as np
 import os
 from datetime import datetime
 import logging
+import hashlib
+import hmac
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from image_preprocessing import open_image_buffer, preprocess_for_dtype, reduce_on_decode
+from inference_backends import create_backend
+from model_manager import LoadedModel, ModelManager
+from model_registry import ModelEntry, ModelRegistry, UnknownModelError, load_registry_file
+from inference_batcher import DeadlineExceededError, MicroBatcher, QueueFullError, QueueTimeoutError
+from prediction_cache import NearDuplicateCache, PredictionCache, make_cache_key, perceptual_hash
+from serving_metrics import CONTENT_TYPE, LATENCY_BUCKETS, PIXEL_BUCKETS, SIZE_BUCKETS, MetricsRegistry
+from request_tracing import TraceWriter, format_server_timing, make_request_id
+from sampling_profiler import SamplingProfiler
+from memory_accounting import MemoryAccountant, read_rss_bytes
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,96 +33,543 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Global variables
-model = None
+# Labels of the default model (the serving models themselves live in model_registry)
 class_names = [
     'Bacterial Leaf Blight', 'Brown Spot', 'Healthy Rice Leaf',
     'Leaf Blast', 'Leaf Scald', 'Leaf Smut', 'Not a Rice Leaf',
     'Rice Hispa', 'Sheath Blight'
 ]
 
-def load_model_emergency():
-    """Emergency model loading with maximum compatibility"""
-    global model
+# Serving configuration (overridable through environment variables)
+SERVING_CONFIG = {
+    'backend': os.environ.get('INFERENCE_BACKEND', 'keras'),
+    'model_path': os.environ.get('MODEL_PATH', 'rice_emergency_model.h5'),
+    'tflite_model_path': os.environ.get('TFLITE_MODEL_PATH', 'rice_emergency_model.tflite'),
+    'onnx_model_path': os.environ.get('ONNX_MODEL_PATH', 'rice_emergency_model.onnx'),
+    'num_threads': int(os.environ.get('INFERENCE_NUM_THREADS', 0)),
+    'inter_op_threads': int(os.environ.get('INFERENCE_INTER_OP_THREADS', 0)),
+    'graph_optimization': os.environ.get('ONNX_GRAPH_OPTIMIZATION', 'all'),
+    # uint8: the Keras graph takes raw pixels and rescales them itself (float32 for parity checks)
+    'input_dtype': os.environ.get('SERVING_INPUT_DTYPE', 'uint8'),
+    'batch_max_size': int(os.environ.get('BATCH_MAX_SIZE', 8)),
+    'batch_max_wait_ms': float(os.environ.get('BATCH_MAX_WAIT_MS', 5)),
+    'max_queue_depth': int(os.environ.get('MAX_QUEUE_DEPTH', 64)),
+    'max_queue_wait_ms': float(os.environ.get('MAX_QUEUE_WAIT_MS', 30000)),
+    # Deadline for single-image requests without a deadline header (0: none);
+    # matches the mobile app's 2 minute request timeout
+    'request_deadline_ms': float(os.environ.get('REQUEST_DEADLINE_MS', 120000)),
+    'model_load_wait_seconds': float(os.environ.get('MODEL_LOAD_WAIT_SECONDS', 10)),
+    'model_load_retry_initial_seconds': float(os.environ.get('MODEL_LOAD_RETRY_INITIAL_SECONDS', 5)),
+    'model_load_retry_max_seconds': float(os.environ.get('MODEL_LOAD_RETRY_MAX_SECONDS', 300)),
+    # Hot reload: poll the model file for changes (0: off, reload through /admin/reload only)
+    'model_watch_interval_seconds': float(os.environ.get('MODEL_WATCH_INTERVAL_SECONDS', 0)),
+    'model_drain_timeout_seconds': float(os.environ.get('MODEL_DRAIN_TIMEOUT_SECONDS', 300)),
+    # Batch sizes run through the model before it reports ready (default: 1..BATCH_MAX_SIZE)
+    'warmup_batch_sizes': os.environ.get('WARMUP_BATCH_SIZES', ''),
+    # Bearer token for /admin/* endpoints (disabled when unset)
+    'admin_token': os.environ.get('ADMIN_TOKEN', ''),
+    # Several models side by side (see model_registry.py); unset: serve the model above as MODEL_NAME
+    'model_registry_path': os.environ.get('MODEL_REGISTRY_PATH', ''),
+    'model_name': os.environ.get('MODEL_NAME', 'emergency'),
+    'model_memory_budget_mb': float(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0)),
+    'batch_request_max_images': int(os.environ.get('BATCH_REQUEST_MAX_IMAGES', 64)),
+    'batch_request_max_bytes': int(os.environ.get('BATCH_REQUEST_MAX_BYTES', 32 * 1024 * 1024)),
+    'stream_request_max_images': int(os.environ.get('STREAM_REQUEST_MAX_IMAGES', 1000)),
+    'stream_request_max_bytes': int(os.environ.get('STREAM_REQUEST_MAX_BYTES', 512 * 1024 * 1024)),
+    # A base64 JSON body is parsed whole in memory (multipart files are spooled to disk)
+    'stream_request_max_json_bytes': int(os.environ.get('STREAM_REQUEST_MAX_JSON_BYTES', 32 * 1024 * 1024)),
+    'raw_upload_max_bytes': int(os.environ.get('RAW_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)),
+    'decode_workers': int(os.environ.get('DECODE_WORKERS', 4)),
+    'cache_max_entries': int(os.environ.get('PREDICTION_CACHE_ENTRIES', 1024)),
+    'cache_max_bytes': int(os.environ.get('PREDICTION_CACHE_MAX_BYTES', 16 * 1024 * 1024)),
+    'cache_ttl_seconds': float(os.environ.get('PREDICTION_CACHE_TTL_SECONDS', 3600)),
+    'near_duplicate_max_entries': int(os.environ.get('NEAR_DUPLICATE_CACHE_ENTRIES', 0)),
+    'near_duplicate_max_distance': int(os.environ.get('NEAR_DUPLICATE_MAX_DISTANCE', 3)),
+    'metrics_enabled': os.environ.get('METRICS_ENABLED', '1') != '0',
+    # Per-request JSON trace records (empty path: off)
+    'trace_log_path': os.environ.get('TRACE_LOG_PATH', 'logs/request_traces.jsonl'),
+    'trace_log_max_bytes': int(os.environ.get('TRACE_LOG_MAX_BYTES', 10 * 1024 * 1024)),
+    'trace_log_backups': int(os.environ.get('TRACE_LOG_BACKUPS', 3)),
+    # On-demand sampling profiler (/admin/profile, or SIGUSR2 to a worker pid - not the gunicorn master)
+    'profile_output_dir': os.environ.get('PROFILE_OUTPUT_DIR', 'profiles'),
+    'profile_interval_ms': float(os.environ.get('PROFILE_INTERVAL_MS', 5)),
+    'profile_max_seconds': float(os.environ.get('PROFILE_MAX_SECONDS', 300)),
+    'profile_signal_seconds': float(os.environ.get('PROFILE_SIGNAL_SECONDS', 30)),
+    'profile_include_idle': os.environ.get('PROFILE_INCLUDE_IDLE', '0') == '1',
+    # Memory samples every N requests (/admin/memory); tracemalloc frames, 0: off until started there
+    'memory_sample_every': int(os.environ.get('MEMORY_SAMPLE_EVERY', 100)),
+    'memory_history': int(os.environ.get('MEMORY_HISTORY', 288)),
+    'memory_tracemalloc_frames': int(os.environ.get('MEMORY_TRACEMALLOC_FRAMES', 0)),
+}
+
+def get_model_path(backend_name):
+    """Model artifact served by the given backend"""
+    return {
+        'tflite': SERVING_CONFIG['tflite_model_path'],
+        'onnx': SERVING_CONFIG['onnx_model_path'],
+    }.get(backend_name, SERVING_CONFIG['model_path'])
+
+# Prometheus metrics for /metrics (see serving_metrics.py)
+metrics = MetricsRegistry(enabled=SERVING_CONFIG['metrics_enabled'])
+stage_seconds = metrics.histogram(
+    'rice_api_stage_seconds', 'Time spent in each prediction stage (inference: per forward pass)',
+    LATENCY_BUCKETS, ['stage'])
+STAGES = {stage: stage_seconds.labels(stage) for stage in
+          ('upload', 'cache_lookup', 'decode', 'perceptual_hash', 'preprocess', 'inference', 'serialize')}
+request_seconds = metrics.histogram(
+    'rice_api_request_seconds', 'Request latency (streamed responses: until the body starts)',
+    LATENCY_BUCKETS, ['endpoint', 'status'])
+request_bytes = metrics.histogram('rice_api_request_bytes', 'Request body size', SIZE_BUCKETS, ['endpoint'])
+image_width = metrics.histogram('rice_api_image_width_pixels', 'Width of uploaded images as sent', PIXEL_BUCKETS)
+image_height = metrics.histogram('rice_api_image_height_pixels', 'Height of uploaded images as sent', PIXEL_BUCKETS)
+batch_size_histogram = metrics.histogram(
+    'rice_api_batch_size', 'Images per forward pass',
+    list(range(1, SERVING_CONFIG['batch_max_size'] + 1)))
+queue_wait_seconds = metrics.histogram(
+    'rice_api_queue_wait_seconds', 'Time images waited in the inference queue', LATENCY_BUCKETS)
+cache_results = metrics.counter('rice_api_cache_results', 'Prediction cache outcome per image', ['result'])
+CACHE_RESULTS = {result: cache_results.labels(result) for result in ('exact', 'near_duplicate', 'miss')}
+
+def observe_stage(stage, started):
+    """Record the time since `started` (perf_counter) for a stage; returns the current time
     
+    On a request thread the time is also added to the request's Server-Timing
+    breakdown (stages run in the decode pool only reach the histograms).
+    """
+    now = time.perf_counter()
+    STAGES[stage].observe(now - started)
+    if has_request_context():
+        add_request_timing(stage, now - started)
+    return now
+
+def add_request_timing(name, seconds):
+    timings = g.setdefault('timings', {})
+    timings[name] = timings.get(name, 0.0) + seconds
+
+def record_batch_metrics(size, queue_waits, inference_seconds, failed):
+    """MicroBatcher on_batch hook"""
+    batch_size_histogram.observe(size)
+    STAGES['inference'].observe(inference_seconds)
+    for wait in queue_waits:
+        queue_wait_seconds.observe(wait)
+
+def run_serving_model(batch):
+    """Run one batched forward pass through the default model serving right now"""
+    return model_manager.current.backend(batch)
+
+# Concurrent /predict requests share forward passes through this batcher.
+# Requests pass the backend they leased, so batches never mix two models.
+batcher = MicroBatcher(
+    run_serving_model,
+    max_batch_size=SERVING_CONFIG['batch_max_size'],
+    max_wait_ms=SERVING_CONFIG['batch_max_wait_ms'],
+    max_queue_depth=SERVING_CONFIG['max_queue_depth'],
+    max_queue_wait_ms=SERVING_CONFIG['max_queue_wait_ms'],
+    on_batch=record_batch_metrics
+)
+
+# Image decoding for multi-image requests runs in parallel (PIL releases the GIL)
+decode_pool = ThreadPoolExecutor(
+    max_workers=SERVING_CONFIG['decode_workers'],
+    thread_name_prefix='image-decode'
+)
+
+# Resubmitted photos are answered from here without decoding or inference
+prediction_cache = PredictionCache(
+    max_entries=SERVING_CONFIG['cache_max_entries'],
+    max_bytes=SERVING_CONFIG['cache_max_bytes'],
+    ttl_seconds=SERVING_CONFIG['cache_ttl_seconds']
+)
+
+# Optional second tier for retaken photos of the same leaf (disabled when 0 entries)
+near_duplicate_cache = NearDuplicateCache(
+    max_entries=SERVING_CONFIG['near_duplicate_max_entries'],
+    max_distance=SERVING_CONFIG['near_duplicate_max_distance'],
+    ttl_seconds=SERVING_CONFIG['cache_ttl_seconds']
+)
+
+def hash_model_file(model_path):
+    """Short content hash identifying a model version"""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def model_file_fingerprint(model_path):
+    """Cheap (path, size, mtime) fingerprint of a model file on disk"""
     try:
-        logger.info("🚀 Emergency model loading starting...")
-        
-        # Import TensorFlow with minimal config
-        import tensorflow as tf
-        logger.info(f"✅ TensorFlow {tf.__version__} imported")
-        
-        # Configure for minimal memory usage
-        tf.config.set_soft_device_placement(True)
-        
-        # Try to allocate GPU memory incrementally
-        gpus = tf.config.experimental.list_physical_devices('GPU')
-        if gpus:
-            try:
-                for gpu in gpus:
-                    tf.config.experimental.set_memory_growth(gpu, True)
-            except:
-                pass
-        
-        model_path = 'rice_emergency_model.h5'
+        stat = os.stat(model_path)
+    except OSError:
+        return (model_path, None, None)
+    return (model_path, stat.st_size, stat.st_mtime_ns)
+
+# Client deadline headers: remaining budget in ms, or an absolute Unix time in ms
+DEADLINE_TIMEOUT_HEADER = 'X-Request-Timeout-Ms'
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+deadline_stats = {'requests_with_deadline': 0, 'dropped_on_arrival': 0, 'dropped_before_decode': 0,
+                  'dropped_before_inference': 0}
+deadline_stats_lock = threading.Lock()
+
+def count_deadline_event(name):
+    with deadline_stats_lock:
+        deadline_stats[name] += 1
+
+# Request correlation: echoed from the client when well-formed, otherwise generated
+REQUEST_ID_HEADER = 'X-Request-ID'
+PREDICTION_ENDPOINTS = ('predict_disease', 'predict_raw', 'predict_batch', 'predict_stream')
+
+# Background writer for per-request trace records (see request_tracing.py)
+trace_writer = (TraceWriter(SERVING_CONFIG['trace_log_path'],
+                            max_bytes=SERVING_CONFIG['trace_log_max_bytes'],
+                            backup_count=SERVING_CONFIG['trace_log_backups'])
+                if SERVING_CONFIG['trace_log_path'] else None)
+
+# RSS / Python heap / TF allocator samples for /admin/memory (see memory_accounting.py)
+memory_accountant = MemoryAccountant(sample_every=SERVING_CONFIG['memory_sample_every'],
+                                     history=SERVING_CONFIG['memory_history'],
+                                     tracemalloc_frames=SERVING_CONFIG['memory_tracemalloc_frames'])
+
+@app.before_request
+def record_request_start():
+    g.received_at = time.monotonic()
+    g.request_id = make_request_id(request.headers.get(REQUEST_ID_HEADER))
+    
+    # A prediction that waited (e.g. in the listen backlog) past its client's
+    # deadline is answered before its upload is read
+    if request.endpoint in PREDICTION_ENDPOINTS and client_deadline_passed():
+        count_deadline_event('dropped_on_arrival')
+        return deadline_response("Deadline passed before the request was read")
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    elapsed = time.monotonic() - g.received_at if 'received_at' in g else None
+    if elapsed is not None:
+        request_seconds.labels(endpoint, str(response.status_code)).observe(elapsed)
+    if request.content_length:
+        request_bytes.labels(endpoint).observe(request.content_length)
+    
+    if 'request_id' in g:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+    if request.endpoint in PREDICTION_ENDPOINTS and elapsed is not None:
+        timings = {**g.get('timings', {}), 'total': elapsed}
+        trace = g.get('trace', {})
+        descriptions = {'cache': trace['cache_tier']} if trace.get('cache_tier') else None
+        response.headers['Server-Timing'] = format_server_timing(timings, descriptions)
+        if trace_writer is not None:
+            trace_writer.write({
+                'time': datetime.now().isoformat(),
+                'request_id': g.request_id,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'request_bytes': request.content_length,
+                **trace,
+                'timings_ms': {name: round(seconds * 1000.0, 3) for name, seconds in timings.items()},
+            })
+    memory_accountant.record_request()
+    return response
+
+def request_deadline(default_ms=0):
+    """time.monotonic() deadline for the current request, or None
+    
+    The earliest of the client's deadline headers and `default_ms` after the
+    request arrived applies. Malformed header values are ignored.
+    """
+    received_at = g.get('received_at') or time.monotonic()
+    candidates = []
+    if default_ms > 0:
+        candidates.append(received_at + default_ms / 1000.0)
+    
+    try:
+        if DEADLINE_TIMEOUT_HEADER in request.headers:
+            candidates.append(received_at + float(request.headers[DEADLINE_TIMEOUT_HEADER]) / 1000.0)
+        if DEADLINE_HEADER in request.headers:
+            # Wall-clock deadline from the client, converted to the monotonic clock
+            remaining = float(request.headers[DEADLINE_HEADER]) / 1000.0 - time.time()
+            candidates.append(time.monotonic() + remaining)
+    except ValueError:
+        logger.warning("⚠️ Ignoring malformed deadline header")
+    
+    if not candidates:
+        return None
+    count_deadline_event('requests_with_deadline')
+    return min(candidates)
+
+def client_deadline_passed():
+    """True if the client's deadline headers say it has stopped waiting already"""
+    try:
+        if float(request.headers.get(DEADLINE_TIMEOUT_HEADER, 'inf')) <= 0:
+            return True
+        return float(request.headers.get(DEADLINE_HEADER, 'inf')) / 1000.0 <= time.time()
+    except ValueError:
+        return False
+
+def deadline_response(error):
+    """504 for a request whose deadline passed before it could be served"""
+    logger.warning(f"⌛ Prediction dropped: {error}")
+    return jsonify({"error": f"Deadline exceeded: {error}", "success": False}), 504
+
+def resolve_upload(image_data, model, deadline=None):
+    """Answer raw upload bytes from the caches, or decode and preprocess them
+    for `model` (a leased LoadedModel)
+    
+    Returns a dict with the prediction and response cache fields on a hit,
+    or the preprocessed image array (no batch dimension) on a miss. It raises
+    DeadlineExceededError if `deadline` has already passed; on a miss,
+    QueueFullError if the batcher cannot admit it, or another exception if
+    the bytes are not a readable image.
+    """
+    upload = {"cache_key": None, "image_hash": None, "prediction": None,
+              "cache": {"cached": False}, "array": None}
+    
+    # Don't spend hashing or decode time on a request nobody is waiting for any more
+    if deadline is not None and time.monotonic() > deadline:
+        count_deadline_event('dropped_before_decode')
+        raise DeadlineExceededError("Deadline passed before decode")
+    
+    # Cache entries are scoped to the model and its file hash, so a reload
+    # or another registry model never sees them
+    namespace = cache_namespace(model)
+    
+    # Same bytes and model as a recent request
+    started = time.perf_counter()
+    if prediction_cache.enabled:
+        upload["cache_key"] = make_cache_key(image_data, namespace)
+        prediction = prediction_cache.get(upload["cache_key"])
+        started = observe_stage('cache_lookup', started)
+        if prediction is not None:
+            CACHE_RESULTS['exact'].inc()
+            upload.update(prediction=prediction, cache={"cached": True, "cache_tier": "exact"})
+            return upload
+    
+    # Nor on one the batcher would turn away
+    batcher.check_admission()
+    
+    # Decode at reduced JPEG scale: the hash and the model need <= 224 px
+    started = time.perf_counter()
+    image = open_image_buffer(image_data)
+    image_width.observe(image.width)
+    image_height.observe(image.height)
+    image = reduce_on_decode(image, model.entry.input_size)
+    image.load()
+    started = observe_stage('decode', started)
+    
+    # Visually near-identical to a recent upload (e.g. the same leaf retaken)
+    if near_duplicate_cache.enabled:
+        upload["image_hash"] = perceptual_hash(image)
+        match = None
+        if upload["image_hash"] is not None:
+            match = near_duplicate_cache.get(namespace, upload["image_hash"])
+        started = observe_stage('perceptual_hash', started)
+        if match is not None:
+            CACHE_RESULTS['near_duplicate'].inc()
+            prediction, distance = match
+            upload.update(prediction=prediction, cache={
+                "cached": True, "cache_tier": "near_duplicate", "hamming_distance": distance})
+            return upload
+    
+    CACHE_RESULTS['miss'].inc()
+    upload["array"] = preprocess_for_dtype(image, model.backend.input_dtype, model.entry.input_size)[0]
+    observe_stage('preprocess', started)
+    return upload
+
+def cache_namespace(model):
+    return f"{model.entry.key}:{model.version}"
+
+def store_cached_prediction(upload, prediction, model):
+    """Remember a prediction for a resolve_upload() miss in both cache tiers"""
+    if upload["cache_key"] is not None:
+        prediction_cache.put(upload["cache_key"], prediction)
+    if upload["image_hash"] is not None:
+        near_duplicate_cache.put(cache_namespace(model), upload["image_hash"], prediction)
+
+def load_model_emergency(entry):
+    """Emergency model loading with maximum compatibility
+    
+    Returns a LoadedModel of a registry entry for its ModelManager to serve;
+    raises on failure.
+    """
+    try:
+        logger.info(f"🚀 Emergency model loading starting ({entry.key})...")
+        backend_name = entry.backend
+        model_path = entry.model_path
         
         if not os.path.exists(model_path):
-            logger.error(f"❌ Model file not found: {model_path}")
-            return False
+            raise FileNotFoundError(f"Model file not found: {model_path}")
         
         file_size = os.path.getsize(model_path)
         logger.info(f"📊 Model file size: {file_size:,} bytes")
         
-        if file_size < 1000000:
-            logger.error("❌ Model file too small")
-            return False
+        if backend_name == 'keras' and file_size < 1000000:
+            raise ValueError(f"Model file too small: {file_size:,} bytes")
         
         # Load model with minimal settings
-        logger.info("📥 Loading model...")
-        model = tf.keras.models.load_model(model_path, compile=False)
+        logger.info(f"📥 Loading model with {backend_name} backend...")
+        loaded = create_backend(
+            backend_name,
+            model_path,
+            num_threads=SERVING_CONFIG['num_threads'],
+            inter_op_threads=SERVING_CONFIG['inter_op_threads'],
+            graph_optimization=SERVING_CONFIG['graph_optimization'],
+            input_dtype=entry.input_dtype
+        )
         
         logger.info("✅ Model loaded successfully!")
-        logger.info(f"📐 Input shape: {model.input_shape}")
-        logger.info(f"📐 Output shape: {model.output_shape}")
+        logger.info(f"📐 Input shape: {loaded.input_shape}")
+        logger.info(f"📐 Output shape: {loaded.output_shape}")
+        logger.info(f"🔢 Input dtype: {loaded.input_dtype}")
         
-        # Test prediction
-        test_input = np.random.random((1, 224, 224, 3)).astype(np.float32)
-        test_pred = model.predict(test_input, verbose=0)
-        logger.info(f"✅ Test prediction successful: {test_pred.shape}")
+        # Traces/allocates for every batch size before the model reports ready
+        warmup = warm_up_model(loaded, entry)
         
-        return True
+        model_version = hash_model_file(model_path)
+        logger.info(f"🏷️ Model version: {model_version}")
+        model = LoadedModel(loaded, model_version, model_path, entry)
+        model.warmup = warmup
+        return model
         
     except Exception as e:
         logger.error(f"❌ Model loading failed: {e}")
         logger.error(f"Error type: {type(e).__name__}")
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
-        return False
+        raise
+
+# Bundled sample leaves: the warmup inputs, and the fixed probe set a
+# reloaded model must handle before it is swapped in
+SAMPLE_IMAGES = ['healthy_rice_leaf.jpg', 'diseased_rice_leaf.jpg', 'bacterial_blight_leaf.jpg']
+
+def read_sample_images():
+    """Encoded bytes of the sample leaves (a seeded random JPEG if none are deployed)"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for name in SAMPLE_IMAGES:
+        path = os.path.join(base_dir, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                samples.append(f.read())
+    
+    if not samples:
+        logger.warning("⚠️ No sample images found, warming up with a random image")
+        pixels = np.random.default_rng(0).integers(0, 256, (600, 400, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, 'JPEG', quality=85)
+        samples.append(buffer.getvalue())
+    return samples
+
+def prepare_sample_batch(samples, input_dtype, size):
+    """Decode and preprocess encoded images the way resolve_upload() does, as one batch"""
+    arrays = []
+    for image_data in samples:
+        image = reduce_on_decode(open_image_buffer(image_data), size)
+        arrays.append(preprocess_for_dtype(image, input_dtype, size)[0])
+    return np.stack(arrays)
+
+def warmup_batch_sizes():
+    """WARMUP_BATCH_SIZES, or every batch size the batcher can form"""
+    if SERVING_CONFIG['warmup_batch_sizes']:
+        return [int(size) for size in SERVING_CONFIG['warmup_batch_sizes'].split(',')]
+    return list(range(1, SERVING_CONFIG['batch_max_size'] + 1))
 
-def preprocess_image_simple(image):
-    """Simple, reliable image preprocessing"""
+def warm_up_model(loaded, entry):
+    """Run each served batch size through decode, preprocessing and the model
+    
+    The first call at a batch size traces graphs (Keras), resizes tensors
+    (TFLite) or allocates buffers (ONNX Runtime); doing it here keeps that
+    cost off the first real requests. Returns the warmup timings.
+    """
+    started = time.perf_counter()
+    samples = read_sample_images()
+    batch_ms = {}
+    
+    for batch_size in warmup_batch_sizes():
+        batch_started = time.perf_counter()
+        inputs = [samples[i % len(samples)] for i in range(batch_size)]
+        outputs = loaded(prepare_sample_batch(inputs, loaded.input_dtype, entry.input_size))
+        if len(outputs) != batch_size:
+            raise ValueError(f"Warmup batch of {batch_size} returned {len(outputs)} rows")
+        batch_ms[str(batch_size)] = (time.perf_counter() - batch_started) * 1000.0
+    
+    seconds = time.perf_counter() - started
+    logger.info(f"🔥 Warmup finished in {seconds:.2f}s "
+                f"(batch sizes {', '.join(batch_ms)}; slowest {max(batch_ms.values()):.0f} ms)")
+    return {"seconds": seconds, "batch_ms": batch_ms, "sample_images": len(samples)}
+
+def validate_model(candidate, current):
+    """Probe-set checks a reloaded model must pass before serving (raises ValueError)
+    
+    Also reports how often the candidate agrees with the model it replaces.
+    """
+    labels = candidate.entry.class_names
+    samples = read_sample_images()
+    probe = prepare_sample_batch(samples, candidate.backend.input_dtype, candidate.entry.input_size)
+    outputs = np.asarray(candidate.backend(probe))
+    
+    if outputs.shape != (len(probe), len(labels)):
+        raise ValueError(f"Probe output shape {outputs.shape}, expected {(len(probe), len(labels))}")
+    if not np.all(np.isfinite(outputs)):
+        raise ValueError("Probe outputs contain NaN or infinity")
+    if not np.allclose(outputs.sum(axis=1), 1.0, atol=1e-3):
+        raise ValueError("Probe outputs are not class probabilities")
+    
+    report = {"probe_images": len(probe),
+              "predictions": [labels[i] for i in np.argmax(outputs, axis=1)]}
+    
+    # The serving backend may not be thread-safe (TFLite): run it through the batcher
     try:
-        # Convert to RGB
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Resize to model input size
-        image = image.resize((224, 224))
-        
-        # Convert to array and normalize
-        image_array = np.array(image, dtype=np.float32)
-        image_array = image_array / 255.0
-        
-        # Add batch dimension
-        image_array = np.expand_dims(image_array, axis=0)
-        
-        return image_array
-        
-    except Exception as e:
-        raise Exception(f"Image preprocessing failed: {e}")
+        current_probe = prepare_sample_batch(samples, current.backend.input_dtype, current.entry.input_size)
+        futures = [batcher.submit(row, predict_fn=current.backend) for row in current_probe]
+        previous = np.stack([future.result() for future in futures])
+        report["top1_agreement"] = float(np.mean(np.argmax(outputs, 1) == np.argmax(previous, 1)))
+    except QueueFullError:
+        report["top1_agreement"] = None
+    
+    logger.info(f"🧪 Probe set passed: {report}")
+    return report
+
+def create_model_manager(entry):
+    """Background loader for one registry model, shared by every request (never loads inline)"""
+    manager = ModelManager(
+        lambda: load_model_emergency(entry),
+        retry_initial_seconds=SERVING_CONFIG['model_load_retry_initial_seconds'],
+        retry_max_seconds=SERVING_CONFIG['model_load_retry_max_seconds'],
+        validate_fn=validate_model,
+        drain_timeout_seconds=SERVING_CONFIG['model_drain_timeout_seconds']
+    )
+    if SERVING_CONFIG['model_watch_interval_seconds'] > 0:
+        manager.watch(lambda: model_file_fingerprint(entry.model_path),
+                      SERVING_CONFIG['model_watch_interval_seconds'])
+    return manager
+
+def create_model_registry():
+    """Registry from MODEL_REGISTRY_PATH, or just the model configured through the environment"""
+    budget = SERVING_CONFIG['model_memory_budget_mb'] * 1024 * 1024
+    
+    if SERVING_CONFIG['model_registry_path']:
+        entries, default, file_budget = load_registry_file(SERVING_CONFIG['model_registry_path'])
+        logger.info(f"📚 Model registry: {[entry.key for entry in entries]}")
+        return ModelRegistry(entries, create_model_manager, default=default,
+                             memory_budget_bytes=budget or file_budget or 0)
+    
+    entry = ModelEntry(
+        SERVING_CONFIG['model_name'],
+        get_model_path(SERVING_CONFIG['backend']),
+        backend=SERVING_CONFIG['backend'],
+        class_names=class_names,
+        input_dtype=SERVING_CONFIG['input_dtype'],
+        pinned=True
+    )
+    return ModelRegistry([entry], create_model_manager, memory_budget_bytes=budget)
+
+model_registry = create_model_registry()
+
+# Loader of the default model
+model_manager = model_registry.default_manager
 
 def get_treatment_info(disease_name):
-    """Get treatment for detected disease"""
+    """Get treatment for detected disease (display or snake_case label)"""
     treatments = {
         'Bacterial Leaf Blight': 'Apply copper-based bactericides (Copper oxychloride 50% WP @ 3g/L). Improve field drainage and avoid over-fertilization with nitrogen.',
         'Brown Spot': 'Apply fungicides like Mancozeb 75% WP @ 2g/L. Improve soil fertility with balanced fertilizers and ensure proper water management.',
@@ -116,91 +581,653 @@ def get_treatment_info(disease_name):
         'Rice Hispa': 'Apply contact insecticides like Chlorpyrifos 20% EC @ 2ml/L. Remove grassy weeds that serve as alternate hosts.',
         'Sheath Blight': 'Apply fungicides like Validamycin 3% L @ 2.5ml/L. Improve drainage and avoid dense planting.'
     }
-    return treatments.get(disease_name, 'Consult your local agricultural extension officer for specific treatment recommendations.')
+    by_label = {name.lower(): treatment for name, treatment in treatments.items()}
+    label = disease_name.replace('_', ' ').lower()
+    label = TREATMENT_LABEL_ALIASES.get(label, label)
+    return by_label.get(label, 'Consult your local agricultural extension officer for specific treatment recommendations.')
+
+# Short labels used by some label files (e.g. class_names_emergency.json)
+TREATMENT_LABEL_ALIASES = {'healthy': 'healthy rice leaf'}
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    model_manager.start()
+    model = model_manager.current
     return jsonify({
         "status": "healthy",
         "model_loaded": model is not None,
+        "model_state": model_manager.status(),
+        "model_version": model.version if model is not None else None,
+        "backend": model.backend.name if model is not None else SERVING_CONFIG['backend'],
+        "models_resident": model_registry.get_stats()['resident'],
         "version": "emergency-v1.0",
         "num_classes": len(class_names),
         "timestamp": datetime.now().isoformat(),
         "message": "🌾 Rice Disease Detection API - Emergency Cloud Version"
     })
 
+# Model selector: ?model=, this header, or a 'model' form/JSON field ("name" or "name@version")
+MODEL_SELECTOR_HEADER = 'X-Model'
+
+def requested_model_name():
+    """Registry selector of the current request, or None for the default model"""
+    name = request.args.get('model') or request.headers.get(MODEL_SELECTOR_HEADER)
+    if name:
+        return name
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        return request.form.get('model')
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            return body.get('model')
+    return None
+
+def select_model():
+    """(leased LoadedModel, error response) for the requested model
+    
+    Loads the model if it is not resident and waits for it like
+    ensure_model_loaded(). The model is leased in the same registry step
+    that selects it, so it cannot be evicted or unloaded before the request
+    runs; return it with model.release().
+    """
+    try:
+        entry, manager, model = model_registry.acquire(requested_model_name())
+    except UnknownModelError as e:
+        return None, unknown_model_response(e)
+    if model is not None:
+        return model, None
+    
+    error_response = ensure_model_loaded(manager)
+    if error_response is not None:
+        return None, error_response
+    _, manager, model = model_registry.acquire(entry.key)
+    if model is None:
+        # Evicted or unloaded again while this request waited for the load
+        return None, model_unavailable_response(manager, "Model is being reloaded")
+    return model, None
+
+def unknown_model_response(error):
+    return jsonify({
+        "error": f"Unknown model: {error.args[0]}",
+        "available_models": list(model_registry.entries),
+        "success": False
+    }), 404
+
+def ensure_model_loaded(manager):
+    """Wait briefly for a model load in progress, returning a 503 response if not ready
+    
+    A failed model is not waited for: it cannot be ready before its next
+    retry, which the 503's Retry-After reports.
+    """
+    if manager.wait_loading(SERVING_CONFIG['model_load_wait_seconds']):
+        return None
+    
+    status = manager.status()
+    message = ("Model is still loading" if status['state'] == 'loading'
+               else f"Model loading failed: {status['last_error']}")
+    return model_unavailable_response(manager, message)
+
+def model_unavailable_response(manager, message):
+    """503 telling the client when the model should be loaded"""
+    response = jsonify({
+        "error": f"{message}. Please try again in a few moments.",
+        "model_state": manager.state,
+        "success": False
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(manager.retry_after())
+    return response
+
+def build_prediction(predictions, class_names):
+    """Per-image prediction result from one row of model output"""
+    predicted_class_idx = np.argmax(predictions)
+    predicted_disease = class_names[predicted_class_idx]
+    confidence = float(predictions[predicted_class_idx])
+    
+    return {
+        "disease": predicted_disease,
+        "confidence": confidence,
+        "treatment": get_treatment_info(predicted_disease),
+        "all_predictions": {
+            class_names[i]: float(predictions[i]) 
+            for i in range(len(class_names))
+        }
+    }
+
 @app.route('/predict', methods=['POST'])
 def predict_disease():
     """Main prediction endpoint"""
     try:
-        # Check if model is loaded
-        if model is None:
-            logger.warning("Model not loaded, attempting emergency load...")
-            if not load_model_emergency():
-                return jsonify({
-                    "error": "Model loading failed. Please try again in a few moments.",
-                    "success": False
-                }), 500
+        started = time.perf_counter()
         
         # Handle image input
-        image = None
-        
         if 'image' in request.files:
             # File upload
             image_file = request.files['image']
             if image_file.filename == '':
                 return jsonify({"error": "No image file selected"}), 400
-            image = Image.open(image_file)
+            image_data = image_file.read()
             
         elif request.is_json and 'image_base64' in request.json:
             # Base64 image
             try:
                 image_data = base64.b64decode(request.json['image_base64'])
-                image = Image.open(io.BytesIO(image_data))
             except Exception as e:
                 return jsonify({"error": f"Invalid base64 image: {str(e)}"}), 400
         else:
             return jsonify({"error": "No image provided. Send as 'image' file or 'image_base64' in JSON."}), 400
+        observe_stage('upload', started)
+        
+        # Check if the requested model is loaded
+        model, error_response = select_model()
+        if error_response is not None:
+            return error_response
+        
+        try:
+            return predict_image_data(image_data, model, request_deadline(SERVING_CONFIG['request_deadline_ms']))
+        finally:
+            model.release()
+        
+    except Exception as e:
+        logger.error(f"❌ Prediction error: {e}")
+        return jsonify({
+            "error": f"Prediction failed: {str(e)}",
+            "success": False
+        }), 500
+
+def predict_image_data(image_data, model, deadline=None):
+    """Prediction response for the raw bytes (or buffer) of one uploaded image
+    
+    `model` is the lease from select_model(): the whole request runs on the
+    model serving when it started, even if a reload swaps in another one
+    meanwhile.
+    """
+    response = app.make_response(predict_with_model(image_data, model, deadline))
+    set_model_headers(response, model)
+    return response
 
-        # Preprocess image
-        processed_image = preprocess_image_simple(image)
+def invalid_image_message(error):
+    """Client-facing message for an upload that could not be read as an image"""
+    if isinstance(error, UnidentifiedImageError):
+        # PIL's message names the internal file object, e.g. its repr
+        return "Could not decode image"
+    return f"Invalid image: {error}"
+
+def predict_with_model(image_data, model, deadline=None):
+    """Prediction response (or error tuple) for one image using a leased model"""
+    try:
+        upload = resolve_upload(image_data, model, deadline)
+    except QueueFullError as e:
+        return overloaded_response(e)
+    except DeadlineExceededError as e:
+        return deadline_response(e)
+    except Exception as e:
+        return jsonify({"error": invalid_image_message(e)}), 400
+    
+    prediction = upload["prediction"]
+    batch_timings = {}
+    if prediction is None:
+        # Make prediction (batched with any concurrent requests)
+        logger.debug("🔮 Making prediction...")
+        try:
+            predictions = batcher.predict(upload["array"], deadline=deadline, predict_fn=model.backend,
+                                          timings=batch_timings)
+        except (QueueFullError, QueueTimeoutError) as e:
+            return overloaded_response(e)
+        except DeadlineExceededError as e:
+            count_deadline_event('dropped_before_inference')
+            return deadline_response(e)
+        add_request_timing('queue', batch_timings['queue_wait'])
+        add_request_timing('inference', batch_timings['inference'])
+        prediction = build_prediction(predictions, model.entry.class_names)
+        store_cached_prediction(upload, prediction, model)
+    
+    # The per-request trace record carries this (written off the request thread)
+    cache_tier = upload["cache"].get("cache_tier")
+    logger.debug(f"✅ Prediction: {prediction['disease']} ({prediction['confidence']:.2f}){f' [{cache_tier} cache]' if cache_tier else ''}")
+    g.trace = {
+        "model": model.entry.key,
+        "model_version": model.version,
+        "disease": prediction["disease"],
+        "confidence": prediction["confidence"],
+        "cache_tier": cache_tier,
+        "batch_size": batch_timings.get("batch_size"),
+    }
+    
+    # Prepare response
+    result = {
+        "success": True,
+        "prediction": prediction,
+        **upload["cache"],
+        "model": model.entry.key,
+        "model_version": model.version,
+        "request_id": g.request_id,
+        "timestamp": datetime.now().isoformat(),
+        "version": "emergency-v1.0"
+    }
+    
+    started = time.perf_counter()
+    response = jsonify(result)
+    observe_stage('serialize', started)
+    return response
+
+# Every prediction response names the registry model and version (file hash) that produced it
+MODEL_VERSION_HEADER = 'X-Model-Version'
+
+def set_model_headers(response, model):
+    response.headers[MODEL_SELECTOR_HEADER] = model.entry.key
+    response.headers[MODEL_VERSION_HEADER] = model.version
+
+def overloaded_response(error):
+    """503 with a Retry-After estimate from the batcher's service rate"""
+    logger.warning(f"🚦 Prediction rejected: {error}")
+    response = jsonify({"error": f"Server busy: {error}", "success": False, "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+RAW_UPLOAD_CONTENT_TYPES = ('application/octet-stream', 'image/')
+RAW_READ_CHUNK_BYTES = 256 * 1024
+
+def read_raw_body(max_bytes):
+    """Read the request body into one preallocated buffer
+    
+    Returns (memoryview, error) where error is a (body, status) tuple. The
+    body must declare its Content-Length, which is checked before anything
+    is read.
+    """
+    length = request.content_length
+    if length is None:
+        return None, ({"error": "Content-Length required", "success": False}, 411)
+    if length > max_bytes:
+        return None, ({"error": f"Image too large: {length:,} bytes (limit {max_bytes:,})", "success": False}, 413)
+    if length == 0:
+        return None, ({"error": "Empty request body", "success": False}, 400)
+    
+    buffer = memoryview(bytearray(length))
+    stream = request.stream
+    # gunicorn's wsgi.input (passed through unwrapped) only has read()
+    readinto = getattr(stream, 'readinto', None)
+    received = 0
+    while received < length:
+        if readinto is not None:
+            count = readinto(buffer[received:])
+        else:
+            chunk = stream.read(min(length - received, RAW_READ_CHUNK_BYTES))
+            count = len(chunk)
+            buffer[received:received + count] = chunk
+        if not count:
+            break
+        received += count
+    
+    if received < length:
+        return None, ({"error": f"Incomplete body: {received:,} of {length:,} bytes", "success": False}, 400)
+    return buffer, None
+
+@app.route('/predict/raw', methods=['POST'])
+def predict_raw():
+    """Prediction endpoint for a raw image body (no multipart or base64 wrapping)
+    
+    Send the JPEG/PNG bytes as the request body with Content-Type
+    application/octet-stream or image/*.
+    """
+    try:
+        model, error_response = select_model()
+        if error_response is not None:
+            return error_response
+        
+        try:
+            if not request.mimetype.startswith(RAW_UPLOAD_CONTENT_TYPES):
+                return jsonify({
+                    "error": "Send the image bytes as the body with Content-Type application/octet-stream or image/*",
+                    "success": False
+                }), 415
+            
+            started = time.perf_counter()
+            image_data, error = read_raw_body(SERVING_CONFIG['raw_upload_max_bytes'])
+            if error:
+                return jsonify(error[0]), error[1]
+            observe_stage('upload', started)
+            
+            return predict_image_data(image_data, model, request_deadline(SERVING_CONFIG['request_deadline_ms']))
+        finally:
+            model.release()
+        
+    except Exception as e:
+        logger.error(f"❌ Prediction error: {e}")
+        return jsonify({
+            "error": f"Prediction failed: {str(e)}",
+            "success": False
+        }), 500
+
+def read_batch_uploads(max_images, max_bytes, max_json_bytes=None):
+    """Collect the images of a multi-image request without decoding them
+    
+    Returns (sources, error) where each source is a zero-argument callable
+    producing the raw image bytes, and error is a (body, status) tuple. The
+    body must declare its Content-Length, which is checked against max_bytes
+    before the body is parsed (against max_json_bytes, if given, for JSON).
+    """
+    if request.is_json and max_json_bytes is not None:
+        max_bytes = min(max_bytes, max_json_bytes)
+    length = request.content_length
+    if length is None:
+        return None, ({"error": "Content-Length required", "success": False}, 411)
+    if length > max_bytes:
+        return None, ({"error": f"Request too large: {length:,} bytes (limit {max_bytes:,})", "success": False}, 413)
+    
+    if request.files:
+        files = request.files.getlist('images') or request.files.getlist('image')
+        sources = [file.read for file in files]
+    elif request.is_json:
+        body = request.get_json(silent=True)
+        encoded = body.get('images_base64') if isinstance(body, dict) else None
+        if not isinstance(encoded, list):
+            return None, ({"error": "Send a JSON object with an 'images_base64' array.", "success": False}, 400)
+        sources = [lambda item=item: base64.b64decode(item, validate=True) for item in encoded]
+    else:
+        return None, ({"error": "No images provided. Send 'images' files or an 'images_base64' JSON array.", "success": False}, 400)
+    
+    if not sources:
+        return None, ({"error": "No images provided", "success": False}, 400)
+    if len(sources) > max_images:
+        return None, ({"error": f"Too many images: {len(sources)} (limit {max_images})", "success": False}, 413)
+    
+    return sources, None
+
+def detach_upload_streams():
+    """Take ownership of the request's uploaded file streams
+    
+    The request closes its files when its context ends, which can happen
+    before a streamed response body is generated. Swapping in an empty stream
+    keeps the uploads readable until the caller closes them.
+    """
+    streams = []
+    for _, files in request.files.lists():
+        for file in files:
+            streams.append(file.stream)
+            file.stream = io.BytesIO()
+    return streams
+
+def prepare_upload(source, model, deadline=None):
+    """Read one uploaded image and resolve it against the caches (runs in the decode pool)"""
+    image_data = source()
+    if not image_data:
+        raise ValueError("Empty image")
+    return resolve_upload(image_data, model, deadline)
+
+def check_batch_admission(count):
+    """Raise QueueFullError up front if a request's `count` images would not fit in the queue
+    
+    Capped at the queue depth limit, so a batch larger than the whole queue is
+    still admitted when the queue is empty.
+    """
+    if batcher.max_queue_depth:
+        count = min(count, batcher.max_queue_depth)
+    batcher.check_admission(count)
+
+def iter_batch_results(sources, model, deadline=None):
+    """Yield per-image results in input order, one model-sized chunk at a time
+    
+    Each chunk is decoded in parallel and run through the batcher, so the
+    images of a chunk share batched forward passes. Failures are reported
+    per image and do not stop the rest of the batch.
+    """
+    chunk_size = SERVING_CONFIG['batch_max_size']
+    if batcher.max_queue_depth:
+        # Never queue more of a chunk than check_batch_admission() made room for
+        chunk_size = min(chunk_size, batcher.max_queue_depth)
+    
+    for start in range(0, len(sources), chunk_size):
+        chunk = sources[start:start + chunk_size]
+        decoded = [decode_pool.submit(prepare_upload, source, model, deadline) for source in chunk]
+        
+        # Wait for the whole chunk to decode so it reaches the batcher together
+        prepared = []
+        for decode_future in decoded:
+            try:
+                prepared.append(decode_future.result())
+            except Exception as e:
+                prepared.append(e)
+        
+        futures = []
+        for item in prepared:
+            if isinstance(item, Exception) or item["prediction"] is not None:
+                futures.append(None)
+                continue
+            try:
+                futures.append(batcher.submit(item["array"], deadline, model.backend))
+            except QueueFullError as e:
+                futures.append(e)
+        
+        for offset, (item, predict_future) in enumerate(zip(prepared, futures)):
+            index = start + offset
+            busy = next((x for x in (item, predict_future) if isinstance(x, QueueFullError)), None)
+            if busy is not None:
+                yield {"index": index, "success": False, "error": f"Server busy: {busy}", "retry_after": busy.retry_after}
+                continue
+            if isinstance(item, DeadlineExceededError):
+                yield {"index": index, "success": False, "error": f"Deadline exceeded: {item}"}
+                continue
+            if isinstance(item, Exception):
+                yield {"index": index, "success": False, "error": invalid_image_message(item)}
+                continue
+            
+            if item["prediction"] is not None:
+                yield {"index": index, "success": True, **item["cache"], "prediction": item["prediction"]}
+                continue
+            
+            try:
+                prediction = build_prediction(predict_future.result(), model.entry.class_names)
+            except QueueTimeoutError as e:
+                yield {"index": index, "success": False, "error": f"Server busy: {e}", "retry_after": e.retry_after}
+                continue
+            except DeadlineExceededError as e:
+                count_deadline_event('dropped_before_inference')
+                yield {"index": index, "success": False, "error": f"Deadline exceeded: {e}"}
+                continue
+            except Exception as e:
+                yield {"index": index, "success": False, "error": f"Prediction failed: {e}"}
+                continue
+            
+            store_cached_prediction(item, prediction, model)
+            yield {"index": index, "success": True, **item["cache"], "prediction": prediction}
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Predict diseases for many images in one request"""
+    try:
+        started = time.perf_counter()
+        sources, error = read_batch_uploads(
+            SERVING_CONFIG['batch_request_max_images'],
+            SERVING_CONFIG['batch_request_max_bytes']
+        )
+        if error is not None:
+            return jsonify(error[0]), error[1]
+        observe_stage('upload', started)
         
-        # Make prediction
-        logger.info("🔮 Making prediction...")
-        predictions = model.predict(processed_image, verbose=0)[0]
+        check_batch_admission(len(sources))
         
-        # Get results
-        predicted_class_idx = np.argmax(predictions)
-        predicted_disease = class_names[predicted_class_idx]
-        confidence = float(predictions[predicted_class_idx])
+        model, error_response = select_model()
+        if error_response is not None:
+            return error_response
         
-        logger.info(f"✅ Prediction: {predicted_disease} ({confidence:.2f})")
+        logger.info(f"🔮 Making batch prediction for {len(sources)} images...")
+        try:
+            results = list(iter_batch_results(sources, model, request_deadline()))
+        finally:
+            model.release()
+        succeeded = sum(1 for item in results if item["success"])
         
-        # Prepare response
-        result = {
+        started = time.perf_counter()
+        response = jsonify({
             "success": True,
-            "prediction": {
-                "disease": predicted_disease,
-                "confidence": confidence,
-                "treatment": get_treatment_info(predicted_disease),
-                "all_predictions": {
-                    class_names[i]: float(predictions[i]) 
-                    for i in range(len(class_names))
-                }
-            },
+            "count": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+            "model": model.entry.key,
+            "model_version": model.version,
             "timestamp": datetime.now().isoformat(),
             "version": "emergency-v1.0"
-        }
+        })
+        observe_stage('serialize', started)
+        set_model_headers(response, model)
+        return response
+        
+    except QueueFullError as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"❌ Batch prediction error: {e}")
+        return jsonify({
+            "error": f"Batch prediction failed: {str(e)}",
+            "success": False
+        }), 500
+
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    """Predict many images, streaming one NDJSON line per image as it finishes
+    
+    Takes the same input as /predict/batch. Results are written as soon as
+    their chunk has been through the model, so memory stays flat however
+    many images are sent. Large uploads should be multipart: a base64 JSON
+    body is held in memory and has a lower limit (STREAM_REQUEST_MAX_JSON_BYTES).
+    """
+    try:
+        started = time.perf_counter()
+        sources, error = read_batch_uploads(
+            SERVING_CONFIG['stream_request_max_images'],
+            SERVING_CONFIG['stream_request_max_bytes'],
+            SERVING_CONFIG['stream_request_max_json_bytes']
+        )
+        if error is not None:
+            return jsonify(error[0]), error[1]
+        observe_stage('upload', started)
         
-        return jsonify(result)
+        check_batch_admission(len(sources))
         
+        model, error_response = select_model()
+        if error_response is not None:
+            return error_response
+        
+    except QueueFullError as e:
+        return overloaded_response(e)
     except Exception as e:
-        logger.error(f"❌ Prediction error: {e}")
+        logger.error(f"❌ Stream prediction error: {e}")
         return jsonify({
-            "error": f"Prediction failed: {str(e)}",
+            "error": f"Stream prediction failed: {str(e)}",
             "success": False
         }), 500
+    
+    logger.info(f"🔮 Streaming predictions for {len(sources)} images...")
+    upload_streams = detach_upload_streams()
+    deadline = request_deadline()
+    
+    def generate():
+        try:
+            for item in iter_batch_results(sources, model, deadline):
+                yield json.dumps({**item, "model": model.entry.key, "model_version": model.version}) + "\n"
+        except Exception as e:
+            logger.error(f"❌ Stream prediction error: {e}")
+    
+    def close():
+        # Runs when the server closes the response, even if the body was never iterated
+        model.release()
+        for stream in upload_streams:
+            stream.close()
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(close)
+    response.headers['X-Accel-Buffering'] = 'no'
+    set_model_headers(response, model)
+    return response
+
+@app.route('/model-info', methods=['GET'])
+def model_info():
+    """Inference backend and model details (default model, or ?model=)"""
+    try:
+        entry = model_registry.resolve(requested_model_name())
+    except UnknownModelError as e:
+        return unknown_model_response(e)
+    manager = model_registry.managers[entry.key]
+    model = manager.current
+    return jsonify({
+        "model": entry.key,
+        "model_loaded": model is not None,
+        "model_version": model.version if model is not None else None,
+        "model_state": manager.status(),
+        "backend": model.backend.describe() if model is not None else {"backend": entry.backend},
+        "class_names": entry.class_names,
+        "registry_entry": entry.describe(),
+        "config": {
+            "backend": entry.backend,
+            "model_path": entry.model_path,
+            "num_threads": SERVING_CONFIG['num_threads'],
+            "inter_op_threads": SERVING_CONFIG['inter_op_threads'],
+            "graph_optimization": SERVING_CONFIG['graph_optimization']
+        },
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Registry models, their residency and load/evict/hit counters"""
+    stats = model_registry.get_stats()
+    return jsonify({
+        "default": model_registry.default_key,
+        "models": [
+            {**entry.describe(), **stats['models'][key]}
+            for key, entry in model_registry.entries.items()
+        ],
+        "memory_budget_mb": stats['memory_budget_mb'],
+        "resident_mb": stats['resident_mb'],
+        "timestamp": datetime.now().isoformat()
+    })
+
+def register_stats_metrics():
+    """Expose the batcher, cache and model registry counters on /metrics"""
+    metrics.callback('rice_api_queue_depth', 'Images waiting for inference',
+                     lambda: batcher.get_stats()['queue_depth'])
+    metrics.callback('rice_api_queue_dropped', 'Images not run, by reason',
+                     lambda: {(reason,): batcher.get_stats()[reason]
+                              for reason in ('rejected', 'expired', 'deadline_dropped', 'cancelled')},
+                     type_name='counter', labelnames=['reason'])
+    metrics.callback('rice_api_service_time_seconds', 'Moving average of inference time per image',
+                     lambda: (batcher.get_stats()['service_time_ms'] or 0) / 1000.0)
+    metrics.callback('rice_api_cache_entries', 'Entries per prediction cache tier',
+                     lambda: {('exact',): prediction_cache.get_stats()['entries'],
+                              ('near_duplicate',): near_duplicate_cache.get_stats()['entries']},
+                     labelnames=['tier'])
+    metrics.callback('rice_api_model_events', 'Model registry loads, evictions and hits',
+                     lambda: {(key, event): counters[event]
+                              for key, counters in model_registry.get_stats()['models'].items()
+                              for event in ('loads', 'evictions', 'hits')},
+                     type_name='counter', labelnames=['model', 'event'])
+    metrics.callback('rice_api_model_ready', 'Whether each registry model is loaded',
+                     lambda: {(key,): int(manager.ready) for key, manager in model_registry.managers.items()},
+                     labelnames=['model'])
+    metrics.callback('rice_api_resident_memory_bytes', 'Resident set size of this worker', read_rss_bytes)
+
+register_stats_metrics()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latencies, sizes and serving counters in the Prometheus text format"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/stats', methods=['GET'])
+def serving_stats():
+    """Batching and cache statistics endpoint"""
+    return jsonify({
+        "batching": batcher.get_stats(),
+        "prediction_cache": prediction_cache.get_stats(),
+        "near_duplicate_cache": near_duplicate_cache.get_stats(),
+        "models": model_registry.get_stats(),
+        "deadlines": dict(deadline_stats),
+        "traces": trace_writer.get_stats() if trace_writer is not None else None,
+        "timestamp": datetime.now().isoformat()
+    })
 
 @app.route('/', methods=['GET'])
 def root():
@@ -208,19 +1235,131 @@ def root():
     return jsonify({
         "message": "🌾 Rice Disease Detection API - Emergency Cloud Version",
         "status": "running",
-        "model_loaded": model is not None,
+        "model_loaded": model_manager.ready,
         "version": "emergency-v1.0",
         "endpoints": {
             "health": "/health - Check API status",
-            "predict": "/predict - Detect rice diseases",
+            "predict": "/predict - Detect rice diseases (?model= picks a registry model)",
+            "predict_raw": "/predict/raw - Same as /predict, image bytes as the request body",
+            "predict_batch": "/predict/batch - Detect rice diseases in many images",
+            "predict_stream": "/predict/stream - Same as /predict/batch, streamed as NDJSON",
+            "model_info": "/model-info - Active inference backend",
+            "models": "/models - Registry models and their residency",
+            "stats": "/stats - Batching and cache statistics",
+            "metrics": "/metrics - Prometheus metrics (stage latencies, sizes, queue)",
+            "admin_reload": "/admin/reload - Hot-swap the model file (POST, needs ADMIN_TOKEN)",
+            "admin_memory": "/admin/memory - RSS, Python heap and TF allocator growth (needs ADMIN_TOKEN)",
+            "admin_profile": "/admin/profile - Sample this worker's CPU for ?seconds= (POST, needs ADMIN_TOKEN)",
             "root": "/ - This information"
         },
         "info": "Optimized for cloud deployment with reliable model loading"
     })
 
+def check_admin_token():
+    """Error response unless the request carries ADMIN_TOKEN, else None"""
+    token = SERVING_CONFIG['admin_token']
+    if not token:
+        return jsonify({"error": "Admin endpoints are disabled (ADMIN_TOKEN is not set)", "success": False}), 404
+    
+    supplied = request.headers.get('Authorization', '')
+    supplied = supplied[len('Bearer '):] if supplied.startswith('Bearer ') else request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({"error": "Invalid admin token", "success": False}), 403
+    return None
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+def admin_reload():
+    """Reload the model file without downtime (POST), or report the last reload (GET)
+    
+    The new model is loaded and validated beside the serving one and swapped
+    in atomically; requests already running finish on the old model.
+    """
+    error_response = check_admin_token()
+    if error_response is not None:
+        return error_response
+    
+    try:
+        entry = model_registry.resolve(requested_model_name())
+    except UnknownModelError as e:
+        return unknown_model_response(e)
+    manager = model_registry.managers[entry.key]
+    
+    if request.method == 'POST':
+        started = manager.reload('admin request')
+        status = manager.status()
+        if not started:
+            reason = "a reload is already running" if status['state'] == 'ready' else "the model is not loaded"
+            return jsonify({"error": f"Cannot reload {entry.key}: {reason}", "model_state": status, "success": False}), 409
+        logger.info(f"🔄 Reload of {entry.key} requested through /admin/reload")
+        return jsonify({"success": True, "model": entry.key, "reload_started": True, "model_state": status}), 202
+    
+    return jsonify({"success": True, "model": entry.key, "model_state": manager.status()})
+
+@app.route('/admin/memory', methods=['GET', 'POST'])
+def admin_memory():
+    """Memory samples and growth rates (GET); start or stop tracemalloc (POST ?tracemalloc=start|stop)"""
+    error_response = check_admin_token()
+    if error_response is not None:
+        return error_response
+    
+    if request.method == 'POST':
+        action = request.args.get('tracemalloc', '')
+        if action == 'start':
+            memory_accountant.start_tracing(request.args.get('frames', 1, type=int))
+            logger.info("🧠 tracemalloc started through /admin/memory")
+        elif action == 'stop':
+            memory_accountant.stop_tracing()
+            logger.info("🧠 tracemalloc stopped through /admin/memory")
+        else:
+            return jsonify({"error": "Use ?tracemalloc=start or ?tracemalloc=stop", "success": False}), 400
+    
+    return jsonify({"success": True, "pid": os.getpid(),
+                    "memory": memory_accountant.report(top=request.args.get('top', 10, type=int))})
+
+# Idle until asked: sampling only runs while a profile is being taken
+profiler = SamplingProfiler(SERVING_CONFIG['profile_output_dir'],
+                            interval_seconds=SERVING_CONFIG['profile_interval_ms'] / 1000.0,
+                            max_seconds=SERVING_CONFIG['profile_max_seconds'],
+                            include_idle=SERVING_CONFIG['profile_include_idle'])
+
+def handle_profile_signal(signum, frame):
+    # Signal handlers run between bytecodes of the main thread: hand off rather than log here
+    threading.Thread(target=profiler.start, args=(SERVING_CONFIG['profile_signal_seconds'], 'SIGUSR2'),
+                     daemon=True).start()
+
+if hasattr(signal, 'SIGUSR2') and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGUSR2, handle_profile_signal)
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """Profile this worker for ?seconds= (POST), or report the last profile (GET)
+    
+    Writes a collapsed-stack file (flame graphs) and a pstats dump to
+    PROFILE_OUTPUT_DIR on the worker that handled the request.
+    """
+    error_response = check_admin_token()
+    if error_response is not None:
+        return error_response
+    
+    if request.method == 'POST':
+        try:
+            seconds = float(request.args.get('seconds', 30))
+        except ValueError:
+            return jsonify({"error": "seconds must be a number", "success": False}), 400
+        if not profiler.start(seconds, reason=request.args.get('reason', 'admin request')):
+            return jsonify({"error": "A profile is already running", "profiler": profiler.status(), "success": False}), 409
+        return jsonify({"success": True, "profile_started": True, "profiler": profiler.status()}), 202
+    
+    return jsonify({"success": True, "profiler": profiler.status()})
+
 @app.route('/diseases', methods=['GET'])
 def get_diseases():
-    """Get list of detectable diseases"""
+    """Get list of detectable diseases (default model, or ?model=)"""
+    try:
+        class_names = model_registry.resolve(requested_model_name()).class_names
+    except UnknownModelError as e:
+        return unknown_model_response(e)
+    
     diseases_info = []
     for disease in class_names:
         diseases_info.append({
@@ -233,14 +1372,10 @@ def get_diseases():
         "total_classes": len(class_names)
     })
 
-# Initialize model on startup
+# Initialize model on startup (in the background, so the server answers immediately)
 logger.info("🚀 Starting Rice Disease Detection API - Emergency Version")
-logger.info("📊 Attempting model load on startup...")
-
-if load_model_emergency():
-    logger.info("✅ Startup model loading successful!")
-else:
-    logger.warning("⚠️ Startup model loading failed - will retry on first request")
+logger.info("📊 Loading model in the background...")
+model_registry.start_pinned()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+On-demand sampling CPU profiler for a live API worker.
+
+While a profile runs, a background thread wakes every `interval` seconds,
+reads the Python stack of every other thread (sys._current_frames()) and
+counts identical stacks. Nothing is installed in the interpreter: no
+sys.setprofile/settrace hook, no per-call instrumentation. Between profiles
+the only thing left behind is an idle object, so it is safe to keep enabled
+in production.
+
+All threads are sampled, so one profile covers the Flask request threads,
+the decode pool (PIL) and the micro-batcher thread that calls the model.
+Time spent in native code (libjpeg, TensorFlow kernels) is attributed to
+the Python frame that called into it. Threads parked in a blocking wait
+(idle workers, the batcher waiting for requests) are counted but left out of
+the profile unless include_idle is set.
+
+Each profile writes two files to the output directory:
+
+    profile-<pid>-<time>.collapsed  one "thread;outer;...;inner <samples>" line
+                                    per stack, for flamegraph.pl or speedscope
+    profile-<pid>-<time>.pstats     loadable with pstats.Stats / snakeviz;
+                                    call counts are sample counts and times
+                                    are samples x interval
+
+    profiler = SamplingProfiler('profiles')
+    profiler.start(30, reason='slow uploads')   # returns immediately
+"""
+
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Innermost frames (file basename, function) of a thread that is blocked, not running
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'),
+}
+
+
+def _frame_key(code):
+    """pstats function key: (filename, first line, function name)"""
+    return (code.co_filename, code.co_firstlineno, getattr(code, 'co_qualname', code.co_name))
+
+
+def _frame_label(key):
+    filename, line, name = key
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads for a fixed time, one profile at a time"""
+
+    def __init__(self, output_dir, interval_seconds=0.005, max_seconds=300, include_idle=False):
+        self.output_dir = output_dir
+        self.interval = max(0.001, float(interval_seconds))
+        self.max_seconds = max_seconds
+        self.include_idle = include_idle
+        self._lock = threading.Lock()
+        self._thread = None
+        self._active = None
+        self.last_profile = None
+        self.profiles = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, reason=''):
+        """Start profiling for `seconds` in the background; False if one is running"""
+        seconds = min(max(0.1, float(seconds)), self.max_seconds)
+        with self._lock:
+            if self.running:
+                return False
+            self._active = {
+                'pid': os.getpid(),
+                'reason': reason,
+                'seconds': seconds,
+                'interval_ms': self.interval * 1000.0,
+                'started_at': time.time(),
+            }
+            self._thread = threading.Thread(target=self._run, args=(seconds,),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logger.info(f"🔬 Profiling worker {os.getpid()} for {seconds:.0f}s"
+                    f"{f' ({reason})' if reason else ''}")
+        return True
+
+    def _run(self, seconds):
+        try:
+            stacks, samples, idle = self._sample(seconds)
+            result = {**self._write(stacks, samples), 'idle_thread_samples': idle}
+        except Exception as e:
+            logger.error(f"❌ Profiling failed: {e}")
+            result = {'error': str(e)}
+        with self._lock:
+            self.last_profile = {**self._active, **result, 'finished_at': time.time()}
+            self._active = None
+            self.profiles += 1
+        if 'error' not in result:
+            logger.info(f"🔬 Profile written: {result['collapsed_path']} ({samples} samples)")
+
+    def _sample(self, seconds):
+        """(Counter of (thread name, frame keys from outermost) -> samples, samples, idle thread samples)"""
+        own_id = threading.get_ident()
+        stacks = Counter()
+        samples = idle = 0
+        deadline = time.monotonic() + seconds
+        next_sample = time.monotonic()
+
+        while next_sample < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    idle += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_key(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[(names.get(thread_id, str(thread_id)), tuple(stack))] += 1
+            samples += 1
+
+            next_sample += self.interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.monotonic()  # fell behind: do not burst to catch up
+        return stacks, samples, idle
+
+    def _write(self, stacks, samples):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir,
+                            f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+        with open(base + '.collapsed', 'w') as f:
+            for (thread_name, stack), count in stacks.most_common():
+                labels = [thread_name.replace(';', ':')] + [_frame_label(key) for key in stack]
+                f.write(f"{';'.join(labels)} {count}\n")
+
+        with open(base + '.pstats', 'wb') as f:
+            marshal.dump(self._pstats(stacks), f)
+
+        return {
+            'samples': samples,
+            'stacks': len(stacks),
+            'collapsed_path': base + '.collapsed',
+            'pstats_path': base + '.pstats',
+        }
+
+    def _pstats(self, stacks):
+        """The samples in the dict format pstats.Stats loads (as cProfile writes it)
+
+        {func: (primitive calls, calls, own time, cumulative time, {caller: (...)})}
+        """
+        own, total = Counter(), Counter()
+        callers = {}
+        for (_, stack), count in stacks.items():
+            if not stack:
+                continue
+            own[stack[-1]] += count
+            for key in set(stack):
+                total[key] += count
+            for caller, callee in set(zip(stack, stack[1:])):
+                edges = callers.setdefault(callee, Counter())
+                edges[caller] += count
+
+        stats = {}
+        for key, count in total.items():
+            edges = {caller: (n, n, 0.0, n * self.interval)
+                     for caller, n in callers.get(key, {}).items()}
+            stats[key] = (count, count, own[key] * self.interval, count * self.interval, edges)
+        return stats
+
+    def status(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'active': dict(self._active) if self._active else None,
+                'last_profile': self.last_profile,
+                'profiles': self.profiles,
+                'output_dir': os.path.abspath(self.output_dir),
+                'interval_ms': self.interval * 1000.0,
+                'max_seconds': self.max_seconds,
+                'include_idle': self.include_idle,
+            }
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Low-overhead metrics for the API server, exposed in the Prometheus text
+format (version 0.0.4) on /metrics.
+
+Only what the server needs is implemented, with no dependency on
+prometheus_client: counters, histograms with fixed buckets and callback
+metrics that read existing statistics (batcher, caches) at scrape time.
+Recording an observation is a bisect plus two additions under a lock;
+bench_metrics.py measures the cost.
+
+    registry = MetricsRegistry()
+    stage_seconds = registry.histogram('rice_api_stage_seconds', 'Time per stage',
+                                       LATENCY_BUCKETS, ['stage'])
+    stage_seconds.labels('decode').observe(0.004)
+    text = registry.render()
+"""
+
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 0.5 ms .. 60 s, roughly x2.5 apart
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 1 KB .. 32 MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(8)) + (32 * 1024 * 1024,)
+# Image side lengths in pixels, from thumbnails to 200 MP sensors
+PIXEL_BUCKETS = (224, 320, 480, 640, 800, 1024, 1280, 1600, 2048, 3000, 4032, 6000, 8192, 16384)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The child metric for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        # Counter samples carry a _total suffix, and so does their family name in
+        # HELP/TYPE (as prometheus_client writes it), or scrapers see untyped samples
+        family = f'{self.name}_total' if self.type_name == 'counter' else self.name
+        lines = [f'# HELP {family} {self.documentation}', f'# TYPE {family} {self.type_name}']
+        lines.extend(self._samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('_registry', '_lock', 'value')
+
+    def __init__(self, registry):
+        self._registry = registry
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonic counter"""
+
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild(self._registry)
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in sorted(self._children.items()):
+            yield f'{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}'
+
+
+class _HistogramChild:
+    __slots__ = ('_registry', '_buckets', '_lock', 'counts', 'sum')
+
+    def __init__(self, registry, buckets):
+        self._registry = registry
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+
+    def observe(self, value):
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram (cumulative buckets are computed at scrape time)"""
+
+    type_name = 'histogram'
+
+    def __init__(self, registry, name, documentation, buckets, labelnames=()):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self._registry, self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in sorted(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose samples are read from fn() at scrape time
+
+    fn returns a number, or a dict mapping label value tuples to numbers.
+    """
+
+    def __init__(self, registry, name, documentation, fn, type_name='gauge', labelnames=()):
+        super().__init__(registry, name, documentation, labelnames)
+        self.fn = fn
+        self.type_name = type_name
+
+    def _samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        suffix = '_total' if self.type_name == 'counter' else ''
+        for label_values, value in sorted(values.items()):
+            if value is None:
+                continue
+            yield f'{self.name}{suffix}{_format_labels(self.labelnames, label_values)} {_format_value(value)}'
+
+
+class MetricsRegistry:
+    """Named metrics rendered together; `enabled=False` turns recording into a no-op"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self._add(Histogram(self, name, documentation, buckets, labelnames))
+
+    def callback(self, name, documentation, fn, type_name='gauge', labelnames=()):
+        return self._add(CallbackMetric(self, name, documentation, fn, type_name, labelnames))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
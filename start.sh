@@ -19,4 +19,4 @@ except Exception as e:
 "
 
 echo "🔥 Starting server with extended timeout..."
-exec gunicorn --bind 0.0.0.0:$PORT --timeout 600 --workers 1 --preload rice_disease_api:app
+exec gunicorn --bind 0.0.0.0:$PORT --timeout 600 --workers 1 --threads 8 rice_disease_api:app
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Memory regression test for the inference loop.
+
+Drives thousands of predictions through the API in-process (Flask test
+client, several threads so the micro-batcher forms real batches) with the
+prediction caches off, so every request decodes, preprocesses and runs the
+model. Uploads rotate between multipart, base64 JSON, raw bodies and small
+batches of differently sized images.
+
+RSS is measured after a warm-up (first-call allocations, graph tracing) and
+then after every chunk of requests. The test fails when RSS grows more than
+--max-growth-mb over the run, or when the trend over the second half of the
+run exceeds --max-slope-mb per 1000 requests. This is the check that lets
+the server run without gunicorn --max-requests recycling.
+
+Uses the model configured through the usual environment variables
+(INFERENCE_BACKEND, MODEL_PATH, ...).
+
+Usage:
+    python test_memory_regression.py [--requests 5000] [--max-growth-mb 48] [--tracemalloc]
+"""
+
+import argparse
+import base64
+import gc
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_IMAGES = ['healthy_rice_leaf.jpg', 'diseased_rice_leaf.jpg', 'bacterial_blight_leaf.jpg']
+IMAGE_SIZES = [(224, 224), (640, 480), (1280, 960), (3000, 2000)]
+
+
+def make_payloads(count, seed=0):
+    """Distinct JPEGs: the sample images at several sizes and qualities"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    payloads = []
+    for i in range(count):
+        with Image.open(SAMPLE_IMAGES[i % len(SAMPLE_IMAGES)]) as image:
+            image = image.convert('RGB').resize(IMAGE_SIZES[i % len(IMAGE_SIZES)])
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=rng.randint(60, 95))
+        payloads.append(buffer.getvalue())
+    return payloads
+
+
+def send(client, payloads, i):
+    """One request; the upload format rotates with i"""
+    body = payloads[i % len(payloads)]
+    kind = i % 8
+    if kind < 3:
+        response = client.post('/predict', data={'image': (io.BytesIO(body), 'leaf.jpg')})
+    elif kind < 5:
+        response = client.post('/predict', json={'image_base64': base64.b64encode(body).decode()})
+    elif kind < 7:
+        response = client.post('/predict/raw', data=body, content_type='image/jpeg')
+    else:
+        batch = [payloads[(i + k) % len(payloads)] for k in range(4)]
+        response = client.post('/predict/batch', data={'images': [(io.BytesIO(b), f'{k}.jpg') for k, b in enumerate(batch)]})
+    return response.status_code
+
+
+def settled_rss(read_rss_bytes):
+    gc.collect()
+    return read_rss_bytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000, help='Requests after warm-up')
+    parser.add_argument('--warmup', type=int, default=300, help='Requests before the baseline is taken')
+    parser.add_argument('--chunk', type=int, default=250, help='Requests between RSS samples')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--payloads', type=int, default=48, help='Distinct images to rotate through')
+    parser.add_argument('--max-growth-mb', type=float, default=48.0, help='Allowed RSS growth after warm-up')
+    parser.add_argument('--max-slope-mb', type=float, default=2.0,
+                        help='Allowed RSS trend over the second half, MB per 1000 requests')
+    parser.add_argument('--tracemalloc', action='store_true', help='Report the top Python allocators (slower)')
+    args = parser.parse_args()
+
+    # Every request must reach the model; keep trace records out of the working tree
+    os.environ['PREDICTION_CACHE_ENTRIES'] = '0'
+    os.environ['NEAR_DUPLICATE_CACHE_ENTRIES'] = '0'
+    os.environ['TRACE_LOG_PATH'] = os.path.join(tempfile.mkdtemp(prefix='rice-memtest-'), 'traces.jsonl')
+    os.environ['MEMORY_SAMPLE_EVERY'] = str(args.chunk)
+
+    import rice_disease_api
+    from memory_accounting import growth_per_1000, read_rss_bytes
+
+    print("🧠 Memory regression test for the inference loop")
+    print("=" * 60)
+    if not rice_disease_api.model_manager.wait_ready(timeout=600):
+        print("❌ Model failed to load - set MODEL_PATH / INFERENCE_BACKEND")
+        sys.exit(1)
+
+    client = rice_disease_api.app.test_client()
+    payloads = make_payloads(args.payloads)
+    failures = 0
+
+    def run(start, count):
+        nonlocal failures
+        with ThreadPoolExecutor(args.threads) as pool:
+            for status in pool.map(lambda i: send(client, payloads, i), range(start, start + count)):
+                failures += status != 200
+
+    started = time.time()
+    run(0, args.warmup)
+    if args.tracemalloc:
+        rice_disease_api.memory_accountant.start_tracing(frames=1)
+    baseline = settled_rss(read_rss_bytes)
+    print(f"📏 Baseline RSS after {args.warmup} warm-up requests: {baseline / 2**20:.1f} MB")
+
+    samples = [{'requests': 0, 'rss_bytes': baseline}]
+    done = 0
+    while done < args.requests:
+        count = min(args.chunk, args.requests - done)
+        run(args.warmup + done, count)
+        done += count
+        rss = settled_rss(read_rss_bytes)
+        samples.append({'requests': done, 'rss_bytes': rss})
+        print(f"   {done:6d} requests   RSS {rss / 2**20:8.1f} MB   ({(rss - baseline) / 2**20:+.1f} MB)")
+
+    elapsed = time.time() - started
+    growth_mb = (samples[-1]['rss_bytes'] - baseline) / 2**20
+    second_half = [s for s in samples if s['requests'] >= args.requests // 2]
+    slope_mb = (growth_per_1000(second_half, 'rss_bytes') or 0.0) / 2**20
+
+    print(f"\n⏱️ {args.warmup + args.requests} requests in {elapsed:.0f}s, {failures} non-200 responses")
+    print(f"📈 RSS growth {growth_mb:+.1f} MB (limit {args.max_growth_mb:.0f}), "
+          f"second-half trend {slope_mb:+.2f} MB/1000 requests (limit {args.max_slope_mb:.1f})")
+
+    if args.tracemalloc:
+        print("\n🔎 Top Python allocators since warm-up:")
+        for allocator in rice_disease_api.memory_accountant.top_allocators(10):
+            print(f"   {allocator['growth_bytes'] / 1024:+9.1f} KB  {allocator['location']}")
+
+    passed = failures == 0 and growth_mb <= args.max_growth_mb and slope_mb <= args.max_slope_mb
+    print("\n" + ("✅ PASS: memory stays bounded" if passed else "❌ FAIL: memory grows or requests failed"))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()